@@ -12,7 +12,8 @@ Key Features:
 
 __version__ = "0.3.1"
 
-from .core import main, run_script_analyzer
+from .cli import main
+from .core import run_script_analyzer
 from .powershell import check_psscriptanalyzer_installed, find_powershell, install_psscriptanalyzer
 
 __all__ = [
@@ -0,0 +1,89 @@
+"""On-disk cache of the detected PowerShell environment.
+
+Locating PowerShell and checking for PSScriptAnalyzer each start a PowerShell
+process. The result is stored under ``$XDG_CACHE_HOME/py-psscriptanalyzer`` so
+that repeated hook runs can skip both probes.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from . import __version__
+from .constants import ENVIRONMENT_CACHE_TTL
+
+
+def _cache_file() -> Path:
+    """Get the path of the environment cache file."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "py-psscriptanalyzer" / "env.json"
+
+
+def _identify(powershell_cmd: str) -> Optional[list[Any]]:
+    """Get the resolved path and modification time of a command, which change when PowerShell is moved or updated."""
+    path = shutil.which(powershell_cmd)
+    if path is None:
+        return None
+    try:
+        return [path, os.stat(path).st_mtime_ns]
+    except OSError:
+        return None
+
+
+def load_powershell() -> Optional[str]:
+    """Get the cached PowerShell command, or None if there is no usable cache entry.
+
+    An entry is only usable if it is younger than the TTL, was written by this
+    version of the package and the command still resolves to the same, unmodified
+    executable on PATH.
+    """
+    if os.getenv("PSSA_NO_CACHE"):
+        return None
+
+    path = _cache_file()
+    try:
+        if time.time() - path.stat().st_mtime > ENVIRONMENT_CACHE_TTL:
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(data, dict) or data.get("version") != __version__:
+        return None
+    powershell_cmd = data.get("powershell")
+    if not isinstance(powershell_cmd, str):
+        return None
+    executable = _identify(powershell_cmd)
+    if executable is None or executable != data.get("executable"):
+        return None
+    return powershell_cmd
+
+
+def save_powershell(powershell_cmd: str) -> None:
+    """Record a PowerShell command that has PSScriptAnalyzer available."""
+    if os.getenv("PSSA_NO_CACHE"):
+        return
+
+    executable = _identify(powershell_cmd)
+    if executable is None:
+        return
+
+    path = _cache_file()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a sibling file and rename so concurrent hook runs never read a partial file
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".env-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": __version__, "powershell": powershell_cmd, "executable": executable}, f)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+    except OSError:
+        # The cache is only an optimization; never fail the hook because of it
+        pass
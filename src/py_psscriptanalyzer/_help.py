@@ -0,0 +1,137 @@
+"""Rich-formatted help output for the py-psscriptanalyzer command line."""
+
+import argparse
+import functools
+from typing import Final, Optional
+
+_HEADER_MARKUP: Final[str] = """\
+[bold blue]py-psscriptanalyzer[/]
+[dim]PowerShell static analysis and formatting[/]
+
+[bold green]USAGE[/]
+[cyan]  py-psscriptanalyzer \\[OPTIONS] \\[FILES...]
+[/]
+[bold green]DESCRIPTION[/]
+  Analyze and format PowerShell files using PSScriptAnalyzer.
+  Supports .ps1, .psm1, and .psd1 files with cross-platform compatibility.
+
+[bold green]SEVERITY LEVELS[/]
+[dim]  Information: Shows all issues (Information, Warning, Error)
+  Warning:     Shows Warning and Error issues (default)
+  Error:       Shows only Error issues
+[/]  \n\
+[yellow]  Set SEVERITY_LEVEL environment variable to change the default.
+[/]
+"""
+
+# Rows of the options table; None inserts a blank row between groups
+_OPTIONS: Final[tuple[Optional[tuple[str, str]], ...]] = (
+    ("--format, -f", "Format files instead of analyzing them"),
+    (
+        "--severity, -s",
+        "Set minimum severity level: Information (all), Warning (warn+error), Error (error only)",
+    ),
+    ("--recursive, -r", "Search for PowerShell files recursively from current directory"),
+    ("--help, -h", "Show this help message"),
+    ("--version, -v", "Show version information"),
+    None,
+    # Rule category filters
+    ("--security-only", "Only show security-related findings"),
+    ("--style-only", "Only show code style-related findings"),
+    ("--performance-only", "Only show performance-related findings"),
+    ("--best-practices-only", "Only show best practices-related findings"),
+    ("--dsc-only", "Only show DSC (Desired State Configuration) related findings"),
+    ("--compatibility-only", "Only show compatibility-related findings"),
+    None,
+    # Custom rule selection
+    ("--include-rules", "Comma-separated list of specific rule names to include"),
+    ("--exclude-rules", "Comma-separated list of specific rule names to exclude"),
+    None,
+    # Output format options
+    ("--output-format", "Output format: text, json, or sarif (default: text)"),
+    ("--output-file", "File to write output to (default: output to console)"),
+)
+
+_EXAMPLES_MARKUP: Final[str] = """\
+[bold green]EXAMPLES[/]
+[dim]  # Analyze PowerShell files
+[/][cyan]  py-psscriptanalyzer script.ps1 module.psm1
+
+[/][dim]  # Format PowerShell files
+[/][cyan]  py-psscriptanalyzer --format script.ps1
+
+[/][dim]  # Search recursively for PowerShell files
+[/][cyan]  py-psscriptanalyzer --recursive
+
+[/][dim]  # Show only errors
+[/][cyan]  py-psscriptanalyzer --severity Error *.ps1
+
+[/][dim]  # Show all issues (including informational)
+[/][cyan]  py-psscriptanalyzer --severity Information script.ps1
+
+[/][dim]  # Use environment variable for default severity
+[/][cyan]  export SEVERITY_LEVEL=Error && py-psscriptanalyzer *.ps1
+
+[/][dim]  # Filter for security-related issues only
+[/][cyan]  py-psscriptanalyzer --security-only script.ps1
+
+[/][dim]  # Include only specific rules
+[/][cyan]  py-psscriptanalyzer --include-rules PSAvoidUsingPlainTextForPassword,\\
+    PSAvoidUsingWriteHost script.ps1
+
+[/][dim]  # Generate SARIF output for code scanning integration
+[/][cyan]  py-psscriptanalyzer --output-format sarif --output-file results.sarif *.ps1
+
+[/]"""
+
+
+@functools.lru_cache(maxsize=4)
+def _render_help(width: int) -> str:
+    """Render the help text for a console of the given width."""
+    from rich.table import Table
+    from rich.text import Text
+
+    from .cli import _console
+
+    console = _console()
+
+    # Create options table
+    table = Table(show_header=False, box=None, padding=(0, 2))
+    table.add_column("Option", style="cyan", width=20)
+    table.add_column("Description", style="white")
+    for row in _OPTIONS:
+        if row is None:
+            table.add_row()
+        else:
+            table.add_row(*row)
+
+    # Render everything to console and capture
+    with console.capture() as capture:
+        # Print header sections without panel
+        console.print(Text.from_markup(_HEADER_MARKUP))
+
+        # Add a separator line (ASCII-safe for Windows compatibility)
+        console.print("-" * min(width, 80), style="bold blue")
+        console.print()
+
+        console.print("OPTIONS", style="bold green")
+        console.print(table)
+        console.print()
+
+        # Add another separator line before examples
+        console.print("-" * min(width, 80), style="bold blue")
+        console.print()
+
+        console.print(Text.from_markup(_EXAMPLES_MARKUP))
+
+    return str(capture.get())
+
+
+class RichHelpFormatter(argparse.HelpFormatter):
+    """Custom help formatter using Rich for beautiful output."""
+
+    def format_help(self) -> str:
+        """Format the entire help message with Rich styling."""
+        from .cli import _console
+
+        return _render_help(_console().width)
@@ -0,0 +1,47 @@
+"""JSON encoding and decoding, using orjson when it is installed.
+
+orjson is not a dependency; it is picked up opportunistically because it parses
+and serializes large result sets several times faster than the standard library.
+Both paths produce the same two-space indented, ASCII-only output.
+"""
+
+import json
+from typing import Any, TextIO, Union
+
+try:
+    import orjson
+
+    _HAS_ORJSON = True
+except ImportError:  # pragma: no cover - depends on the environment
+    _HAS_ORJSON = False
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse a JSON document, given as text or as UTF-8 encoded bytes.
+
+    Raises ``json.JSONDecodeError`` for invalid input with either backend.
+    """
+    if _HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_indented(obj: Any) -> str:
+    """Serialize ``obj`` as JSON indented by two spaces, with non-ASCII characters escaped."""
+    if _HAS_ORJSON:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        # orjson cannot escape non-ASCII characters, and unescaped output fails on streams that cannot encode them,
+        # so the rare documents that contain any are left to the standard library
+        if data.isascii():
+            return data.decode()
+    return json.dumps(obj, indent=2)
+
+
+def dump_indented(obj: Any, out: TextIO) -> None:
+    """Write ``obj`` to ``out`` as JSON indented by two spaces, with non-ASCII characters escaped."""
+    if _HAS_ORJSON:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        if data.isascii():
+            out.write(data.decode())
+            return
+    json.dump(obj, out, indent=2)
@@ -1,15 +1,16 @@
 """Modern CLI interface for PSScriptAnalyzer with Rich formatting."""
 
 import argparse
+import functools
 import os
-from collections.abc import Sequence
+import stat
+import sys
+from collections.abc import Iterator, Sequence
 from pathlib import Path
-from typing import Optional
-
-from rich.console import Console
-from rich.table import Table
-from rich.text import Text
+from typing import TYPE_CHECKING, Final, Optional
 
+from ._help import RichHelpFormatter
+from .constants import POWERSHELL_FILE_EXTENSIONS, PRUNED_DIRECTORIES, SEVERITY_LEVELS, RuleFilter
 from .core import run_script_analyzer
 from .powershell import (
     check_psscriptanalyzer_installed,
@@ -17,8 +18,32 @@ from .powershell import (
     install_psscriptanalyzer,
 )
 
-# Create a simple console with minimal configuration for maximum compatibility
-console = Console()
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from rich.console import Console
+
+_VALID_SEVERITIES: Final[frozenset[str]] = frozenset(SEVERITY_LEVELS)
+_VERSION_FLAGS: Final[frozenset[str]] = frozenset(("-v", "--version"))
+
+# Rule category options: argparse destination, the flag it sets and its label in the status line
+_RULE_FILTER_OPTIONS: Final[tuple[tuple[str, RuleFilter, str], ...]] = (
+    ("security_only", RuleFilter.SECURITY, " (security rules only)"),
+    ("style_only", RuleFilter.STYLE, " (style rules only)"),
+    ("performance_only", RuleFilter.PERFORMANCE, " (performance rules only)"),
+    ("best_practices_only", RuleFilter.BEST_PRACTICES, " (best practices only)"),
+    ("dsc_only", RuleFilter.DSC, " (DSC rules only)"),
+    ("compatibility_only", RuleFilter.COMPATIBILITY, " (compatibility rules only)"),
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _console() -> "Console":
+    """Get the shared Rich console, importing Rich on first use to keep startup fast."""
+    from rich.console import Console
+
+    # Messages are plain text: skip the repr highlighter and never hard-wrap long file paths
+    return Console(highlight=False, soft_wrap=True)
 
 
 def get_default_severity() -> str:
@@ -26,146 +51,13 @@ def get_default_severity() -> str:
     env_severity = os.getenv("SEVERITY_LEVEL", "Warning")
 
     # Validate the environment variable value
-    valid_severities = ["All", "Information", "Warning", "Error"]
-    if env_severity in valid_severities:
+    if env_severity in _VALID_SEVERITIES:
         return env_severity
     # Don't use print_error here since console may not be initialized
     # Just silently fall back to Warning
     return "Warning"
 
 
-class RichHelpFormatter(argparse.HelpFormatter):
-    """Custom help formatter using Rich for beautiful output."""
-
-    def format_help(self) -> str:
-        """Format the entire help message with Rich styling."""
-        # Create the main help content
-        help_text = Text()
-
-        # Title section
-        help_text.append("py-psscriptanalyzer", style="bold blue")
-        help_text.append("\n")
-        help_text.append("PowerShell static analysis and formatting", style="dim")
-        help_text.append("\n\n")
-
-        # Usage section
-        help_text.append("USAGE", style="bold green")
-        help_text.append("\n")
-        help_text.append("  py-psscriptanalyzer [OPTIONS] [FILES...]", style="cyan")
-        help_text.append("\n\n")
-
-        # Description
-        help_text.append("DESCRIPTION", style="bold green")
-        help_text.append("\n")
-        help_text.append("  Analyze and format PowerShell files using PSScriptAnalyzer.\n")
-        help_text.append("  Supports .ps1, .psm1, and .psd1 files with cross-platform compatibility.\n\n")
-
-        help_text.append("SEVERITY LEVELS", style="bold green")
-        help_text.append("\n")
-        help_text.append(
-            "  Information: Shows all issues (Information, Warning, Error)\n",
-            style="dim",
-        )
-        help_text.append("  Warning:     Shows Warning and Error issues (default)\n", style="dim")
-        help_text.append("  Error:       Shows only Error issues\n", style="dim")
-        help_text.append("  \n")
-        help_text.append(
-            "  Set SEVERITY_LEVEL environment variable to change the default.\n",
-            style="yellow",
-        )
-        help_text.append("\n")
-
-        # Create options table
-        table = Table(show_header=False, box=None, padding=(0, 2))
-        table.add_column("Option", style="cyan", width=20)
-        table.add_column("Description", style="white")
-
-        table.add_row("--format, -f", "Format files instead of analyzing them")
-        table.add_row(
-            "--severity, -s",
-            "Set minimum severity level: Information (all), Warning (warn+error), Error (error only)",
-        )
-        table.add_row(
-            "--recursive, -r",
-            "Search for PowerShell files recursively from current directory",
-        )
-        table.add_row("--help, -h", "Show this help message")
-        table.add_row("--version, -v", "Show version information")
-        table.add_row()
-
-        # Rule category filters
-        table.add_row("--security-only", "Only show security-related findings")
-        table.add_row("--style-only", "Only show code style-related findings")
-        table.add_row("--performance-only", "Only show performance-related findings")
-        table.add_row("--best-practices-only", "Only show best practices-related findings")
-        table.add_row("--dsc-only", "Only show DSC (Desired State Configuration) related findings")
-        table.add_row("--compatibility-only", "Only show compatibility-related findings")
-        table.add_row()
-
-        # Custom rule selection
-        table.add_row("--include-rules", "Comma-separated list of specific rule names to include")
-        table.add_row("--exclude-rules", "Comma-separated list of specific rule names to exclude")
-        table.add_row()
-
-        # Output format options
-        table.add_row("--output-format", "Output format: text, json, or sarif (default: text)")
-        table.add_row("--output-file", "File to write output to (default: output to console)")
-
-        # Examples section
-        examples_text = Text()
-        examples_text.append("EXAMPLES", style="bold green")
-        examples_text.append("\n")
-        examples_text.append("  # Analyze PowerShell files\n", style="dim")
-        examples_text.append("  py-psscriptanalyzer script.ps1 module.psm1\n\n", style="cyan")
-        examples_text.append("  # Format PowerShell files\n", style="dim")
-        examples_text.append("  py-psscriptanalyzer --format script.ps1\n\n", style="cyan")
-        examples_text.append("  # Search recursively for PowerShell files\n", style="dim")
-        examples_text.append("  py-psscriptanalyzer --recursive\n\n", style="cyan")
-        examples_text.append("  # Show only errors\n", style="dim")
-        examples_text.append("  py-psscriptanalyzer --severity Error *.ps1\n\n", style="cyan")
-        examples_text.append("  # Show all issues (including informational)\n", style="dim")
-        examples_text.append("  py-psscriptanalyzer --severity Information script.ps1\n\n", style="cyan")
-        examples_text.append("  # Use environment variable for default severity\n", style="dim")
-        examples_text.append(
-            "  export SEVERITY_LEVEL=Error && py-psscriptanalyzer *.ps1\n\n",
-            style="cyan",
-        )
-        examples_text.append("  # Filter for security-related issues only\n", style="dim")
-        examples_text.append("  py-psscriptanalyzer --security-only script.ps1\n\n", style="cyan")
-        examples_text.append("  # Include only specific rules\n", style="dim")
-        examples_text.append(
-            "  py-psscriptanalyzer --include-rules PSAvoidUsingPlainTextForPassword,\\\n"
-            "    PSAvoidUsingWriteHost script.ps1\n\n",
-            style="cyan",
-        )
-        examples_text.append("  # Generate SARIF output for code scanning integration\n", style="dim")
-        examples_text.append(
-            "  py-psscriptanalyzer --output-format sarif --output-file results.sarif *.ps1\n\n",
-            style="cyan",
-        )
-
-        # Render everything to console and capture
-        with console.capture() as capture:
-            # Print header sections without panel
-            console.print(help_text)
-
-            # Add a separator line (ASCII-safe for Windows compatibility)
-            console.print("-" * min(console.width, 80), style="bold blue")
-            console.print()
-
-            console.print("OPTIONS", style="bold green")
-            console.print(table)
-            console.print()
-
-            # Add another separator line before examples
-            console.print("-" * min(console.width, 80), style="bold blue")
-            console.print()
-
-            console.print(examples_text)
-
-        return str(capture.get())
-
-
 def create_parser() -> argparse.ArgumentParser:
     """Create the argument parser."""
     parser = argparse.ArgumentParser(
@@ -253,6 +145,7 @@ def create_parser() -> argparse.ArgumentParser:
     return parser
 
 
+@functools.lru_cache(maxsize=1)
 def _get_version_display() -> str:
     """Get formatted version information."""
     try:
@@ -265,48 +158,149 @@ def _get_version_display() -> str:
 
 def print_status(message: str, style: str = "white") -> None:
     """Print a status message with Rich formatting."""
-    console.print(f"[{style}]{message}[/{style}]")
+    _console().print(message, style=style, markup=False)
 
 
 def print_error(message: str) -> None:
     """Print an error message with Rich formatting."""
-    console.print(f"[red]Error:[/red] {message}")
+    from rich.text import Text
+
+    _console().print(Text.assemble(("Error:", "red"), " ", message))
 
 
 def print_success(message: str) -> None:
     """Print a success message with Rich formatting."""
-    console.print(f"[green]OK[/green] {message}")
+    from rich.text import Text
+
+    _console().print(Text.assemble(("OK", "green"), " ", message))
+
+
+def _parse_rule_list(value: Optional[str]) -> Optional[frozenset[str]]:
+    """Parse a comma-separated rule list into a set of names, ignoring surrounding whitespace."""
+    if not value:
+        return None
+    rules = frozenset(name for name in (part.strip() for part in value.split(",")) if name)
+    return rules or None
+
+
+def _get_pruned_directories() -> frozenset[str]:
+    """Get the directory names to skip during recursive discovery, including any from PSSA_PRUNE_DIRS."""
+    extra = os.getenv("PSSA_PRUNE_DIRS", "")
+    if not extra:
+        return PRUNED_DIRECTORIES
+    return PRUNED_DIRECTORIES | {name for name in extra.split(os.pathsep) if name}
+
+
+def _scan(path: str, pruned: frozenset[str]) -> Iterator[str]:
+    """Yield PowerShell file paths beneath ``path`` using a single ``os.scandir`` pass per directory."""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # Match on the name first so non-PowerShell files never need a type lookup; extensions are
+                # case-insensitive, as they are to PowerShell itself
+                if entry.name.lower().endswith(POWERSHELL_FILE_EXTENSIONS) and entry.is_file(follow_symlinks=False):
+                    yield entry.path
+                elif entry.name not in pruned and entry.is_dir(follow_symlinks=False):
+                    yield from _scan(entry.path, pruned)
+    except PermissionError:
+        pass
+
+
+def _fwalk(path: str, pruned: frozenset[str]) -> Iterator[str]:
+    """Yield PowerShell file paths beneath ``path`` using ``os.fwalk``, which resolves entries relative to an open
+    directory descriptor instead of looking up each full path again."""
+    for dirpath, dirnames, filenames, dirfd in os.fwalk(path):
+        dirnames[:] = [name for name in dirnames if name not in pruned]
+        for name in filenames:
+            if not name.lower().endswith(POWERSHELL_FILE_EXTENSIONS):
+                continue
+            try:
+                mode = os.stat(name, dir_fd=dirfd, follow_symlinks=False).st_mode
+            except OSError:
+                # Removed or made unreadable since the directory was listed
+                continue
+            # Like _scan, only regular files count; symlinks are not followed
+            if stat.S_ISREG(mode):
+                yield os.path.join(dirpath, name)
 
 
 def find_powershell_files_recursive(start_dir: Optional[Path] = None) -> list[str]:
     """Find PowerShell files recursively from the start directory."""
-    from .constants import POWERSHELL_FILE_EXTENSIONS
-
     if start_dir is None:
         start_dir = Path.cwd()
 
-    ps_files: list[str] = []
-    for ext in POWERSHELL_FILE_EXTENSIONS:
-        pattern = f"**/*{ext}"
-        ps_files.extend(str(p) for p in start_dir.glob(pattern))
+    walk = _fwalk if hasattr(os, "fwalk") else _scan
+    return sorted(walk(str(start_dir), _get_pruned_directories()))
+
+
+def _probe_environment() -> tuple[Optional[str], bool]:
+    """Find PowerShell and check whether PSScriptAnalyzer is installed for it."""
+    powershell_cmd = find_powershell()
+    if not powershell_cmd:
+        return None, False
+    return powershell_cmd, check_psscriptanalyzer_installed(powershell_cmd)
+
 
-    return sorted(ps_files)
+def _start_probe() -> "Future[tuple[Optional[str], bool]]":
+    """Start ``_probe_environment`` in a background thread.
+
+    The thread is a daemon, so a run that turns out to have no files to analyze exits
+    without waiting for PowerShell to answer.
+    """
+    import threading
+    from concurrent.futures import Future
+
+    future: Future[tuple[Optional[str], bool]] = Future()
+
+    def probe() -> None:
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(_probe_environment())
+        except BaseException as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+
+    threading.Thread(target=probe, name="powershell-probe", daemon=True).start()
+    return future
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
     """Modern main entry point with Rich formatting."""
+    if argv is None:
+        argv = sys.argv[1:]
+    # A lone version flag needs neither the parser nor the environment
+    if len(argv) == 1 and argv[0] in _VERSION_FLAGS:
+        print(_get_version_display())
+        return 0
+
     parser = create_parser()
-    args = parser.parse_args(argv)
+    return _dispatch(parser.parse_args(argv))
+
 
-    # Handle version display
+def _dispatch(args: argparse.Namespace) -> int:
+    """Run the command described by parsed command-line arguments."""
+    # Handle version display; plain output so this path never imports Rich
     if args.version:
-        console.print(_get_version_display(), style="bold blue")
+        print(_get_version_display())
         return 0
 
-    # Get PowerShell files
-    from .constants import POWERSHELL_FILE_EXTENSIONS
+    if not args.recursive:
+        # Use files from command line arguments, analyzing each path only once
+        ps_files = list(dict.fromkeys(f for f in args.files if f.lower().endswith(POWERSHELL_FILE_EXTENSIONS)))
+        if not ps_files:
+            print_status("No PowerShell files specified", "yellow")
+            return 0
+
+    # Reuse the environment found by a previous run, if it is still valid
+    from . import _cache
+
+    powershell_cmd = _cache.load_powershell()
+    probe: Optional[Future[tuple[Optional[str], bool]]] = None
 
     if args.recursive:
+        if not powershell_cmd:
+            # Probing starts PowerShell processes; run that while the tree is being walked
+            probe = _start_probe()
+
         # Find PowerShell files recursively
         print_status("Searching for PowerShell files recursively...", "blue")
         ps_files = find_powershell_files_recursive()
@@ -315,54 +309,48 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         else:
             print_status("No PowerShell files found", "yellow")
             return 0
+
+    if powershell_cmd:
+        print_success(f"Using PowerShell: {powershell_cmd}")
+        print_success("PSScriptAnalyzer is available")
     else:
-        # Use files from command line arguments
-        ps_files = [f for f in args.files if f.endswith(POWERSHELL_FILE_EXTENSIONS)]
+        # Find PowerShell
+        print_status("Finding PowerShell installation...", "blue")
+        powershell_cmd, installed = probe.result() if probe else _probe_environment()
+        if not powershell_cmd:
+            print_error("PowerShell not found. Please install PowerShell Core (pwsh) or Windows PowerShell.")
+            print_status("Visit: https://github.com/PowerShell/PowerShell#get-powershell", "dim")
+            return 1
 
-    if not ps_files:
-        if not args.recursive:
-            print_status("No PowerShell files specified", "yellow")
-        return 0
+        print_success(f"Using PowerShell: {powershell_cmd}")
 
-    # Find PowerShell
-    print_status("Finding PowerShell installation...", "blue")
-    powershell_cmd = find_powershell()
-    if not powershell_cmd:
-        print_error("PowerShell not found. Please install PowerShell Core (pwsh) or Windows PowerShell.")
-        print_status("Visit: https://github.com/PowerShell/PowerShell#get-powershell", "dim")
-        return 1
-
-    print_success(f"Using PowerShell: {powershell_cmd}")
-
-    # Check if PSScriptAnalyzer is installed
-    print_status("Checking PSScriptAnalyzer installation...", "blue")
-    if not check_psscriptanalyzer_installed(powershell_cmd):
-        print_status("PSScriptAnalyzer not found. Installing...", "yellow")
-        if not install_psscriptanalyzer(powershell_cmd):
-            print_error("Failed to install PSScriptAnalyzer")
-            return 1
-        print_success("PSScriptAnalyzer installed successfully")
-    else:
-        print_success("PSScriptAnalyzer is available")
+        # Check if PSScriptAnalyzer is installed
+        print_status("Checking PSScriptAnalyzer installation...", "blue")
+        if not installed:
+            print_status("PSScriptAnalyzer not found. Installing...", "yellow")
+            if not install_psscriptanalyzer(powershell_cmd):
+                print_error("Failed to install PSScriptAnalyzer")
+                return 1
+            print_success("PSScriptAnalyzer installed successfully")
+        else:
+            print_success("PSScriptAnalyzer is available")
+
+        _cache.save_powershell(powershell_cmd)
 
     # Run the analysis or formatting
     action = "Formatting" if args.format else "Analyzing"
 
-    # Update action description based on rule filter
+    # Collect the requested rule categories into a single flag set
+    rule_filter = RuleFilter.NONE
+    for dest, category, _ in _RULE_FILTER_OPTIONS:
+        if getattr(args, dest):
+            rule_filter |= category
+
+    # Update action description based on rule filter (the first selected category wins)
     filter_description = ""
     if not args.format:
-        if args.security_only:
-            filter_description = " (security rules only)"
-        elif args.style_only:
-            filter_description = " (style rules only)"
-        elif args.performance_only:
-            filter_description = " (performance rules only)"
-        elif args.best_practices_only:
-            filter_description = " (best practices only)"
-        elif args.dsc_only:
-            filter_description = " (DSC rules only)"
-        elif args.compatibility_only:
-            filter_description = " (compatibility rules only)"
+        if rule_filter:
+            filter_description = next(label for _, category, label in _RULE_FILTER_OPTIONS if rule_filter & category)
         elif args.include_rules:
             filter_description = " (specific included rules)"
         elif args.exclude_rules:
@@ -371,20 +359,15 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
     print_status(f"{action}{filter_description} {len(ps_files)} PowerShell file(s)...", "blue")
 
     # Parse include/exclude rules if specified
-    include_rules = args.include_rules.split(",") if args.include_rules else None
-    exclude_rules = args.exclude_rules.split(",") if args.exclude_rules else None
+    include_rules = _parse_rule_list(args.include_rules)
+    exclude_rules = _parse_rule_list(args.exclude_rules)
 
     result = run_script_analyzer(
         powershell_cmd,
         ps_files,
         format_files=args.format,
         severity=args.severity,
-        security_only=args.security_only,
-        style_only=args.style_only,
-        performance_only=args.performance_only,
-        best_practices_only=args.best_practices_only,
-        dsc_only=args.dsc_only,
-        compatibility_only=args.compatibility_only,
+        rule_filter=rule_filter,
         include_rules=include_rules,
         exclude_rules=exclude_rules,
         output_format=args.output_format,
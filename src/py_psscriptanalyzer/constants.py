@@ -1,21 +1,54 @@
 """Constants used throughout py-psscriptanalyzer."""
 
+from enum import IntFlag
 from typing import Final
 
 # PowerShell executable names in order of preference
 POWERSHELL_EXECUTABLES: Final[list[str]] = ["pwsh", "pwsh-lts", "powershell"]
 
+# Arguments passed on every PowerShell invocation: skip the user's profile scripts and never wait for input
+POWERSHELL_BASE_ARGS: Final[tuple[str, ...]] = ("-NoProfile", "-NonInteractive")
+
 # Supported PowerShell file extensions
 POWERSHELL_FILE_EXTENSIONS: Final[tuple[str, ...]] = (".ps1", ".psm1", ".psd1")
 
+# Directories skipped during recursive discovery; they never hold first-party PowerShell sources
+PRUNED_DIRECTORIES: Final[frozenset[str]] = frozenset(
+    {
+        ".git",
+        "node_modules",
+        "__pycache__",
+        ".venv",
+        "venv",
+        ".tox",
+        ".mypy_cache",
+        ".ruff_cache",
+        "dist",
+        "build",
+    }
+)
+
 # Severity levels for PSScriptAnalyzer
 SEVERITY_LEVELS: Final[list[str]] = ["All", "Information", "Warning", "Error"]
 
+# Checks for PSScriptAnalyzer through the exit code alone, so nothing has to be formatted, captured or searched
+MODULE_CHECK_SCRIPT: Final[str] = (
+    "if (Get-Module -ListAvailable -Name PSScriptAnalyzer -ErrorAction SilentlyContinue) { exit 0 } else { exit 1 }"
+)
+
 # Timeouts (in seconds)
-POWERSHELL_CHECK_TIMEOUT: Final[int] = 10
 MODULE_CHECK_TIMEOUT: Final[int] = 30
 INSTALL_TIMEOUT: Final[int] = 120
 ANALYSIS_TIMEOUT: Final[int] = 300
+# Time a timed-out process is given to exit after being asked to stop, before it is killed
+PROCESS_STOP_TIMEOUT: Final[int] = 2
+
+# Fewest files for which PowerShell 7+ analyzes in parallel runspaces; below this, loading
+# PSScriptAnalyzer into each runspace costs more than it saves
+PARALLEL_ANALYSIS_MIN_FILES: Final[int] = 8
+
+# How long a detected PowerShell environment is reused before probing again (in seconds)
+ENVIRONMENT_CACHE_TTL: Final[int] = 24 * 60 * 60
 
 # Output formats
 OUTPUT_FORMATS: Final[list[str]] = ["text", "json", "sarif"]
@@ -23,6 +56,19 @@ OUTPUT_FORMATS: Final[list[str]] = ["text", "json", "sarif"]
 # SARIF version for output
 SARIF_VERSION: Final[str] = "2.1.0"
 
+
+class RuleFilter(IntFlag):
+    """Rule categories that results can be restricted to."""
+
+    NONE = 0
+    SECURITY = 1
+    STYLE = 2
+    PERFORMANCE = 4
+    BEST_PRACTICES = 8
+    DSC = 16
+    COMPATIBILITY = 32
+
+
 # Security-related PSScriptAnalyzer rules
 SECURITY_RULES: Final[list[str]] = [
     "AvoidUsingPlainTextForPassword",
@@ -1,16 +1,32 @@
 """Core PSScriptAnalyzer functionality."""
 
-import argparse
-import json
+import contextlib
+import io
 import os
-import subprocess
 import sys
-from collections.abc import Sequence
-from typing import Any, Optional
+from collections.abc import Collection, Iterable, Iterator
+from typing import IO, TYPE_CHECKING, Any, Final, Optional, TextIO, Union
 
-from .constants import ANALYSIS_TIMEOUT, POWERSHELL_FILE_EXTENSIONS, SARIF_VERSION, SEVERITY_LEVELS
-from .powershell import check_psscriptanalyzer_installed, find_powershell, install_psscriptanalyzer
-from .scripts import build_powershell_file_array, generate_analysis_script, generate_format_script
+from .constants import ANALYSIS_TIMEOUT, POWERSHELL_BASE_ARGS, PROCESS_STOP_TIMEOUT, SARIF_VERSION, RuleFilter
+from .scripts import FILE_LIST_EXPRESSION, FILE_LIST_VARIABLE, generate_analysis_script, generate_format_script
+
+if TYPE_CHECKING:
+    import subprocess
+
+_SARIF_SCHEMA: Final[str] = f"https://schemastore.azurewebsites.net/schemas/json/sarif-{SARIF_VERSION}.json"
+
+_UTF8_BOM: Final[bytes] = b"\xef\xbb\xbf"
+
+# Map severity levels to SARIF levels
+_SARIF_LEVELS: Final[dict[Union[str, int], str]] = {
+    "Error": "error",
+    "Warning": "warning",
+    "Information": "note",
+    # PowerShell may return numeric severity values
+    0: "note",  # Information
+    1: "warning",  # Warning
+    2: "error",  # Error
+}
 
 
 def run_script_analyzer(
@@ -18,14 +34,9 @@ def run_script_analyzer(
     files: list[str],
     format_files: bool = False,
     severity: str = "Warning",
-    security_only: bool = False,
-    style_only: bool = False,
-    performance_only: bool = False,
-    best_practices_only: bool = False,
-    dsc_only: bool = False,
-    compatibility_only: bool = False,
-    include_rules: Optional[list[str]] = None,
-    exclude_rules: Optional[list[str]] = None,
+    rule_filter: RuleFilter = RuleFilter.NONE,
+    include_rules: Optional[Collection[str]] = None,
+    exclude_rules: Optional[Collection[str]] = None,
     output_format: str = "text",
     output_file: Optional[str] = None,
 ) -> int:
@@ -33,119 +44,247 @@ def run_script_analyzer(
     if not files:
         return 0
 
-    files_param = build_powershell_file_array(files)
+    # Deferred so that hook runs with no PowerShell files never pay for these imports
+    import json
+    import subprocess
+    import tempfile
 
+    # The script reads the files to process from a list file, so its text does not grow with the file count
     if format_files:
-        ps_command = generate_format_script(files_param)
+        ps_command = generate_format_script(FILE_LIST_EXPRESSION)
     else:
         ps_command = generate_analysis_script(
-            files_param,
+            FILE_LIST_EXPRESSION,
             severity=severity,
-            security_only=security_only,
-            style_only=style_only,
-            performance_only=performance_only,
-            best_practices_only=best_practices_only,
-            dsc_only=dsc_only,
-            compatibility_only=compatibility_only,
+            security_only=bool(rule_filter & RuleFilter.SECURITY),
+            style_only=bool(rule_filter & RuleFilter.STYLE),
+            performance_only=bool(rule_filter & RuleFilter.PERFORMANCE),
+            best_practices_only=bool(rule_filter & RuleFilter.BEST_PRACTICES),
+            dsc_only=bool(rule_filter & RuleFilter.DSC),
+            compatibility_only=bool(rule_filter & RuleFilter.COMPATIBILITY),
             include_rules=include_rules,
             exclude_rules=exclude_rules,
             json_output=(output_format in ["json", "sarif"]),
         )
 
     try:
-        if format_files:
-            # For formatting, just run the command normally
-            result = subprocess.run(
-                [powershell_cmd, "-Command", ps_command],
-                text=True,
-                timeout=ANALYSIS_TIMEOUT,
-                check=False,
-                capture_output=False,
-            )
-            return result.returncode
-
-        if output_format == "text":
-            # Standard console output mode
-            result = subprocess.run(
-                [powershell_cmd, "-Command", ps_command],
-                text=True,
-                timeout=ANALYSIS_TIMEOUT,
-                check=False,
-                capture_output=False,
-            )
-            return result.returncode
-
-        # Handle JSON and SARIF output formats
-        result = subprocess.run(
-            [powershell_cmd, "-Command", ps_command],
-            text=True,
-            timeout=ANALYSIS_TIMEOUT,
-            check=False,
-            capture_output=True,
-        )
-
-        # Parse PowerShell JSON output or empty list if no results
-        json_data = [] if result.returncode == 0 and not result.stdout.strip() else json.loads(result.stdout)
-
-        # If SARIF format is requested, convert JSON to SARIF
-        output_data = convert_to_sarif(json_data, files) if output_format == "sarif" else json_data
-
-        output_json = json.dumps(output_data, indent=2)
-
-        if output_file:
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(output_json)
-        else:
-            print(output_json)
-
-        return result.returncode
+        with tempfile.TemporaryDirectory(prefix="py-psscriptanalyzer-") as workdir:
+            script_path, list_path = _write_inputs(ps_command, files, workdir)
+            # The script is piped in rather than run with -File, which the execution policy could refuse
+            command = [powershell_cmd, *POWERSHELL_BASE_ARGS, "-Command", "-"]
+            env = {**os.environ, FILE_LIST_VARIABLE: list_path}
+            with open(script_path, "rb") as script:
+                if format_files or output_format == "text":
+                    # Formatting and standard console output go straight to the terminal
+                    return _run_powershell(command, script, env)
+                return _run_json_output(command, script, env, files, output_format, output_file)
 
     except subprocess.TimeoutExpired:
-        print("Timeout while running PSScriptAnalyzer")
+        # Errors go to stderr so that they never mix with JSON or SARIF written to stdout
+        print("Timeout while running PSScriptAnalyzer", file=sys.stderr)
+        return 1
+    except subprocess.CalledProcessError as e:
+        print(f"PSScriptAnalyzer failed with exit code {e.returncode}", file=sys.stderr)
         return 1
     except json.JSONDecodeError:
-        print("Error parsing JSON output from PSScriptAnalyzer")
+        print("Error parsing JSON output from PSScriptAnalyzer", file=sys.stderr)
         return 1
     except Exception as e:  # pylint: disable=broad-except
-        print(f"Error processing results: {e}")
+        print(f"Error processing results: {e}", file=sys.stderr)
         return 1
 
 
+@contextlib.contextmanager
+def _pending_output(output_file: Optional[str]) -> Iterator[TextIO]:
+    """Collect output and publish it to ``output_file``, or stdout if None, only if the block completes.
+
+    A timeout, a parse error or a failed run therefore never leaves a truncated report behind, and an existing
+    output file is only replaced once the new one is complete.
+    """
+    if output_file is None:
+        buffer = io.StringIO()
+        yield buffer
+        sys.stdout.write(buffer.getvalue())
+        return
+
+    # Stream into a sibling file so that the final rename stays on one file system
+    pending = f"{output_file}.{os.getpid()}.tmp"
+    try:
+        with open(pending, "x", encoding="utf-8") as f:
+            yield f
+        os.replace(pending, output_file)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(pending)
+        raise
+
+
+def _run_json_output(
+    command: list[str],
+    script: IO[bytes],
+    env: dict[str, str],
+    files: list[str],
+    output_format: str,
+    output_file: Optional[str],
+) -> int:
+    """Run a PowerShell command that prints JSON records and write them out as JSON or SARIF."""
+    import subprocess
+    import threading
+
+    # PowerShell writes one JSON record per line, and each record is parsed as it arrives instead of after the whole
+    # output has been buffered. The lines are read as bytes and handed to the parser undecoded, since the locale's
+    # encoding is not necessarily UTF-8.
+    creationflags = 0
+    if sys.platform == "win32":
+        # A process group of its own lets _stop_process send CTRL_BREAK_EVENT to PowerShell without reaching us
+        creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
+
+    with subprocess.Popen(
+        command, stdin=script, stdout=subprocess.PIPE, env=env, creationflags=creationflags
+    ) as process:
+        expired = threading.Event()
+
+        def expire() -> None:
+            expired.set()
+            _stop_process(process)
+
+        # Popen has no timeout of its own, so stop PowerShell from a timer if it runs too long
+        timer = threading.Timer(ANALYSIS_TIMEOUT, expire)
+        timer.start()
+        try:
+            records = _iter_json_records(process.stdout or ())
+            with _pending_output(output_file) as out:
+                _write_results(records, files, output_format, out)
+                returncode = process.wait()
+                # Output cut short by the timer must not be published
+                timer.cancel()
+                if expired.is_set():
+                    raise subprocess.TimeoutExpired(process.args, ANALYSIS_TIMEOUT)
+                # The script exits with 0 or 1 once analysis completes; any other code means it failed, and the
+                # missing records must not be published as a clean report
+                if returncode not in (0, 1):
+                    raise subprocess.CalledProcessError(returncode, process.args)
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+            # A killed process leaves truncated output; report the timeout rather than a parse error
+            if expired.is_set():
+                raise subprocess.TimeoutExpired(process.args, ANALYSIS_TIMEOUT)
+
+    return returncode
+
+
+def _run_powershell(command: list[str], script: IO[bytes], env: dict[str, str]) -> int:
+    """Run a PowerShell command with its output going to the terminal and get its exit code."""
+    import subprocess
+
+    return subprocess.run(command, stdin=script, env=env, timeout=ANALYSIS_TIMEOUT, check=False).returncode
+
+
+def _stop_process(process: "subprocess.Popen[bytes]") -> None:
+    """Ask a process to exit, and end it and its children if it has not done so within ``PROCESS_STOP_TIMEOUT``."""
+    import signal
+    import subprocess
+
+    if sys.platform == "win32":
+        # CTRL_BREAK_EVENT is the console counterpart of SIGTERM; it fails if the process has already exited
+        with contextlib.suppress(OSError):
+            os.kill(process.pid, signal.CTRL_BREAK_EVENT)
+    else:
+        process.terminate()
+
+    try:
+        process.wait(PROCESS_STOP_TIMEOUT)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+
+    if sys.platform == "win32":
+        # Child processes inherit the output pipe, and reading from it only ends once all of them have exited,
+        # so the whole tree is ended
+        try:
+            subprocess.run(
+                ["taskkill", "/PID", str(process.pid), "/T", "/F"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=PROCESS_STOP_TIMEOUT,
+                check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+    else:
+        process.kill()
+
+
+def _write_inputs(script: str, files: list[str], workdir: str) -> tuple[str, str]:
+    """Write a script to pipe to ``-Command -`` and its file list into ``workdir`` and get both paths."""
+    script_path = os.path.join(workdir, "run.ps1")
+    list_path = os.path.join(workdir, "files.txt")
+    # -Command - reads its input line by line like an interactive session, where a blank line ends a statement that
+    # spans several lines, so blank lines are dropped and one is added to end the script
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{line}\n" for line in script.splitlines() if line.strip())
+        f.write("\n")
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{path}\n" for path in files)
+    return script_path, list_path
+
+
+def _iter_json_records(lines: Iterable[bytes]) -> Iterator[Any]:
+    """Parse newline-delimited UTF-8 JSON records, skipping blank lines and byte order marks."""
+    from . import _json
+
+    for line in lines:
+        # Windows PowerShell may prefix its output with a BOM, which neither JSON parser accepts
+        line = line.removeprefix(_UTF8_BOM)
+        if line.strip():
+            yield _json.loads(line)
+
+
+def _write_json_array(records: Iterable[Any], out: TextIO) -> None:
+    """Write records as a JSON array one element at a time, formatted as ``json.dumps(indent=2)`` would."""
+    from . import _json
+
+    separator = "[\n  "
+    for record in records:
+        out.write(separator)
+        out.write(_json.dumps_indented(record).replace("\n", "\n  "))
+        separator = ",\n  "
+    out.write("[]\n" if separator == "[\n  " else "\n]\n")
+
+
+def _write_results(records: Iterable[Any], files: list[str], output_format: str, out: TextIO) -> None:
+    """Write analysis records to ``out`` as a JSON array or a SARIF log."""
+    from . import _json
+
+    if output_format == "sarif":
+        # The SARIF driver lists every rule ahead of the results, so the log is assembled before writing
+        _json.dump_indented(convert_to_sarif(list(records), files), out)
+        out.write("\n")
+    else:
+        _write_json_array(records, out)
+
+
+def _file_uri(path: str, uris: dict[str, str], cwd: str) -> str:
+    """Get the file URI for a path relative to ``cwd``, resolving each distinct path only once."""
+    uri = uris.get(path)
+    if uri is None:
+        # Equivalent to os.path.abspath, without looking up the working directory again for every path
+        uri = uris[path] = f"file://{os.path.normpath(os.path.join(cwd, path))}"
+    return uri
+
+
 def convert_to_sarif(ps_results: list[dict[str, Any]], files: list[str]) -> dict[str, Any]:
     """Convert PSScriptAnalyzer results to SARIF format."""
-    # Map severity levels to SARIF levels
-    severity_map = {
-        "Error": "error",
-        "Warning": "warning",
-        "Information": "note",
-        # PowerShell may return numeric severity values
-        0: "note",  # Information
-        1: "warning",  # Warning
-        2: "error",  # Error
-    }
+    # File URIs by path; results usually repeat the same few files
+    uris: dict[str, str] = {}
+    cwd = os.getcwd()
+    artifacts = [{"location": {"uri": _file_uri(f, uris, cwd)}} for f in dict.fromkeys(files)]
 
-    # Create base SARIF structure
-    sarif = {
-        "$schema": f"https://schemastore.azurewebsites.net/schemas/json/sarif-{SARIF_VERSION}.json",
-        "version": SARIF_VERSION,
-        "runs": [
-            {
-                "tool": {
-                    "driver": {
-                        "name": "PSScriptAnalyzer",
-                        "semanticVersion": "1.x",
-                        "informationUri": "https://github.com/PowerShell/PSScriptAnalyzer",
-                        "rules": [],
-                    }
-                },
-                "results": [],
-                "artifacts": [{"location": {"uri": f"file://{os.path.abspath(f)}"}} for f in files],
-            }
-        ],
-    }
-
-    # Track rules we've already added
-    rules_added = set()
+    # Rule metadata by rule id, in the order rules are first reported
+    rules: dict[str, dict[str, Any]] = {}
+    results: list[dict[str, Any]] = []
 
     # Ensure ps_results is a list
     ps_results = [ps_results] if ps_results and not isinstance(ps_results, list) else ps_results
@@ -160,102 +299,56 @@ def convert_to_sarif(ps_results: list[dict[str, Any]], files: list[str]) -> dict
         column = result.get("Column", 1)
 
         # Add rule metadata if not already added
-        if rule_id and rule_id not in rules_added:
+        if rule_id and rule_id not in rules:
             # Determine tags based on rule category
             tags = []
             if result.get("IsSecurityRule", False):
                 tags.append("security")
 
-            # Add other category tags
-            rule_category = result.get("RuleCategory", "")
-            if rule_category and rule_category.lower() not in [t.lower() for t in tags]:
-                tags.append(rule_category.lower())
-
-            # Type annotation for mypy
-            sarif_runs = sarif["runs"]
-            if isinstance(sarif_runs, list) and len(sarif_runs) > 0:
-                driver = sarif_runs[0]["tool"]["driver"]
-                if isinstance(driver, dict) and "rules" in driver:
-                    driver["rules"].append(
-                        {
-                            "id": rule_id,
-                            "shortDescription": {"text": rule_id},
-                            "properties": {"tags": tags, "category": result.get("RuleCategory", "")},
-                        }
-                    )
-            rules_added.add(rule_id)
+            # Add other category tags; tags are all lower case already
+            rule_category = result.get("RuleCategory", "").lower()
+            if rule_category and rule_category not in tags:
+                tags.append(rule_category)
+
+            rules[rule_id] = {
+                "id": rule_id,
+                "shortDescription": {"text": rule_id},
+                "properties": {"tags": tags, "category": result.get("RuleCategory", "")},
+            }
 
         # Add result
-        sarif_result = {
-            "ruleId": rule_id,
-            "level": severity_map.get(severity, "warning"),
-            "message": {"text": message},
-            "locations": [
-                {
-                    "physicalLocation": {
-                        "artifactLocation": {"uri": f"file://{os.path.abspath(file_path)}"},
-                        "region": {"startLine": line, "startColumn": column},
+        results.append(
+            {
+                "ruleId": rule_id,
+                "level": _SARIF_LEVELS.get(severity, "warning"),
+                "message": {"text": message},
+                "locations": [
+                    {
+                        "physicalLocation": {
+                            "artifactLocation": {"uri": _file_uri(file_path, uris, cwd)},
+                            "region": {"startLine": line, "startColumn": column},
+                        }
                     }
-                }
-            ],
-        }
-
-        # Type annotation for mypy
-        sarif_runs = sarif["runs"]
-        if isinstance(sarif_runs, list) and len(sarif_runs) > 0 and "results" in sarif_runs[0]:
-            sarif_runs[0]["results"].append(sarif_result)
-
-    return sarif
-
-
-def main(argv: Optional[Sequence[str]] = None) -> int:
-    """Main entry point."""
-    parser = argparse.ArgumentParser(description="py-psscriptanalyzer - PowerShell static analysis and formatting")
-    parser.add_argument(
-        "--format",
-        action="store_true",
-        help="Format files instead of just analyzing them",
-    )
-    parser.add_argument(
-        "--severity",
-        choices=SEVERITY_LEVELS,
-        default="Warning",
-        help="Severity level to report: All (shows all levels), Information, Warning, Error (default: Warning)",
-    )
-    parser.add_argument("files", nargs="*", help="Files to check")
-
-    args = parser.parse_args(argv)
-
-    # Filter for PowerShell files
-    ps_files = [f for f in args.files if f.endswith(POWERSHELL_FILE_EXTENSIONS)]
-
-    if not ps_files:
-        return 0
-
-    # Find PowerShell
-    powershell_cmd = find_powershell()
-    if not powershell_cmd:
-        print(
-            "Error: PowerShell not found. Please install PowerShell Core (pwsh) or Windows PowerShell.",
-            file=sys.stderr,
-        )
-        print(
-            "Visit: https://github.com/PowerShell/PowerShell#get-powershell",
-            file=sys.stderr,
+                ],
+            }
         )
-        return 1
-
-    print(f"Using PowerShell: {powershell_cmd}")
-
-    # Check if PSScriptAnalyzer is installed
-    if not check_psscriptanalyzer_installed(powershell_cmd):
-        if not install_psscriptanalyzer(powershell_cmd):
-            print("Error: Failed to install PSScriptAnalyzer", file=sys.stderr)
-            return 1
-        print("PSScriptAnalyzer installed successfully")
-
-    # Run the analysis or formatting
-    action = "Formatting" if args.format else "Analyzing"
-    print(f"{action} {len(ps_files)} PowerShell file(s)...")
 
-    return run_script_analyzer(powershell_cmd, ps_files, format_files=args.format, severity=args.severity)
+    # Create SARIF structure
+    return {
+        "$schema": _SARIF_SCHEMA,
+        "version": SARIF_VERSION,
+        "runs": [
+            {
+                "tool": {
+                    "driver": {
+                        "name": "PSScriptAnalyzer",
+                        "semanticVersion": "1.x",
+                        "informationUri": "https://github.com/PowerShell/PSScriptAnalyzer",
+                        "rules": list(rules.values()),
+                    }
+                },
+                "results": results,
+                "artifacts": artifacts,
+            }
+        ],
+    }
@@ -1,56 +1,59 @@
 """PowerShell detection and module management utilities."""
 
-import subprocess
+import shutil
 from typing import Optional
 
-from .constants import INSTALL_TIMEOUT, MODULE_CHECK_TIMEOUT, POWERSHELL_CHECK_TIMEOUT, POWERSHELL_EXECUTABLES
+from .constants import (
+    INSTALL_TIMEOUT,
+    MODULE_CHECK_SCRIPT,
+    MODULE_CHECK_TIMEOUT,
+    POWERSHELL_BASE_ARGS,
+    POWERSHELL_EXECUTABLES,
+)
 
 
 def find_powershell() -> Optional[str]:
     """Find PowerShell executable on the system."""
+    # A PATH lookup is enough; starting PowerShell just to print its version costs far more
     for name in POWERSHELL_EXECUTABLES:
-        try:
-            result = subprocess.run(
-                [name, "-Command", "$PSVersionTable.PSVersion"],
-                capture_output=True,
-                text=True,
-                timeout=POWERSHELL_CHECK_TIMEOUT,
-                check=False,
-            )
-            if result.returncode == 0:
-                return name
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            continue
+        if shutil.which(name):
+            return name
 
     return None
 
 
 def check_psscriptanalyzer_installed(powershell_cmd: str) -> bool:
     """Check if PSScriptAnalyzer module is available."""
+    import subprocess
+
     try:
         result = subprocess.run(
             [
                 powershell_cmd,
+                *POWERSHELL_BASE_ARGS,
                 "-Command",
-                "Get-Module -ListAvailable -Name PSScriptAnalyzer",
+                MODULE_CHECK_SCRIPT,
             ],
-            capture_output=True,
-            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
             timeout=MODULE_CHECK_TIMEOUT,
             check=False,
         )
-        return result.returncode == 0 and "PSScriptAnalyzer" in result.stdout
+        return result.returncode == 0
     except subprocess.TimeoutExpired:
         return False
 
 
 def install_psscriptanalyzer(powershell_cmd: str) -> bool:
     """Install PSScriptAnalyzer module."""
+    import subprocess
+
     print("PSScriptAnalyzer not found. Installing...")
     try:
         result = subprocess.run(
             [
                 powershell_cmd,
+                *POWERSHELL_BASE_ARGS,
                 "-Command",
                 "Install-Module -Name PSScriptAnalyzer -Force -Scope CurrentUser",
             ],
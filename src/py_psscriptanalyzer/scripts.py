@@ -1,30 +1,71 @@
 """PowerShell script generation utilities."""
 
-from typing import Optional
+import functools
+import textwrap
+from collections.abc import Collection
+from typing import Final, Optional
+
+from .constants import (
+    BEST_PRACTICES_RULES,
+    COMPATIBILITY_RULES,
+    DSC_RULES,
+    PARALLEL_ANALYSIS_MIN_FILES,
+    PERFORMANCE_RULES,
+    SECURITY_RULES,
+    STYLE_RULES,
+)
+
+# Generated scripts are piped to PowerShell and find the UTF-8 list of files to process, one per line, through
+# this environment variable
+FILE_LIST_VARIABLE: Final[str] = "PSSA_FILE_LIST"
+# ReadAllLines reads the whole list in one call, where Get-Content emits and decorates one object per line
+FILE_LIST_EXPRESSION: Final[str] = (
+    f"[System.IO.File]::ReadAllLines($env:{FILE_LIST_VARIABLE}, [System.Text.Encoding]::UTF8)"
+)
+
+
+def _dedent(script: str) -> str:
+    """Remove the indentation the script text has in this module, along with leading and trailing blank lines."""
+    return textwrap.dedent(script).strip("\n") + "\n"
 
 
 def escape_powershell_path(path: str) -> str:
     """Escape a file path for use in PowerShell."""
-    return path.replace("'", "''")
+    # Most paths contain no quote, and the membership test is cheaper than a replace that finds nothing
+    return path.replace("'", "''") if "'" in path else path
 
 
 def build_powershell_file_array(files: list[str]) -> str:
     """Build a PowerShell array string from a list of files."""
-    escaped_files = [f"'{escape_powershell_path(f)}'" for f in files]
-    return ",".join(escaped_files)
+    return ",".join(f"'{escape_powershell_path(f)}'" for f in files)
 
 
+@functools.lru_cache(maxsize=8)
 def generate_format_script(files_param: str) -> str:
     """Generate PowerShell script for formatting files."""
-    return f"""
+    return _dedent(f"""
         $files = @({files_param})
         $exitCode = 0
+        # Files without a byte order mark are read like Get-Content would: as ANSI by Windows PowerShell, and as UTF-8
+        # by PowerShell 7, which skips files that are not valid UTF-8 rather than replacing their bytes
+        if ($PSVersionTable.PSEdition -eq "Core") {{
+            $defaultEncoding = [System.Text.UTF8Encoding]::new($false, $true)
+        }} else {{
+            $defaultEncoding = [System.Text.Encoding]::Default
+        }}
         foreach ($file in $files) {{
             try {{
-                $originalContent = Get-Content -Path $file -Raw
+                # Read and write through .NET directly, keeping the file's encoding and byte order mark
+                $reader = [System.IO.StreamReader]::new($file, $defaultEncoding, $true)
+                try {{
+                    $originalContent = $reader.ReadToEnd()
+                    $encoding = $reader.CurrentEncoding
+                }} finally {{
+                    $reader.Dispose()
+                }}
                 $formatted = Invoke-Formatter -ScriptDefinition $originalContent
                 if ($formatted -ne $originalContent) {{
-                    Set-Content -Path $file -Value $formatted -NoNewline
+                    [System.IO.File]::WriteAllText($file, $formatted, $encoding)
                     Write-Host "Formatted: $file"
                 }}
             }} catch {{
@@ -33,12 +74,11 @@ def generate_format_script(files_param: str) -> str:
             }}
         }}
         exit $exitCode
-        """
+        """)
 
 
-def _generate_github_actions_output() -> str:
-    """Generate PowerShell code for GitHub Actions issue reporting."""
-    return """
+# PowerShell code for GitHub Actions issue reporting
+_GITHUB_ACTIONS_OUTPUT: Final[str] = """
                         # Use GitHub Actions annotations
                         $annotationType = switch ($issue.Severity) {
                             "Error" { "error" }
@@ -49,18 +89,14 @@ def _generate_github_actions_output() -> str:
 
                         # GitHub Actions annotation format - this is all we need for GitHub Actions
                         # It will automatically display in the proper format in the GitHub UI
-                        $annotation = "::" + $annotationType + " file=" + $issue.ScriptName + `
-                            ",line=" + $issue.Line + ",title=" + $issue.RuleName + "::" + $issue.Message
-                        Write-Host $annotation
-
+                        $annotation = "::{0} file={1},line={2},title={3}::{4}" -f `
+                            $annotationType, $issue.ScriptName, $issue.Line, $issue.RuleName, $issue.Message
                         # Add a blank line for better readability in logs
-                        Write-Host ""
+                        [void]$annotations.AppendLine($annotation).AppendLine()
     """
 
-
-def _generate_terminal_output() -> str:
-    """Generate PowerShell code for terminal issue reporting."""
-    return """
+# PowerShell code for terminal issue reporting
+_TERMINAL_OUTPUT: Final[str] = """
                         # Set color based on severity for local terminal
                         $severityColor = switch ($issue.Severity) {
                             "Error" { "Red" }
@@ -75,28 +111,58 @@ def _generate_terminal_output() -> str:
                         Write-Host ""
     """
 
-
-def _generate_issue_reporting_logic() -> str:
-    """Generate PowerShell code for issue reporting logic."""
-    github_output = _generate_github_actions_output()
-    terminal_output = _generate_terminal_output()
-
-    return f"""
-                foreach ($issue in $issues) {{
-                    $fileName = Split-Path -Leaf $issue.ScriptName
-                    $location = "$($fileName): Line $($issue.Line):1"
-
-                    if ($isGitHubActions) {{{github_output}
-                    }} else {{{terminal_output}
+# PowerShell code for issue reporting logic
+_ISSUE_REPORTING: Final[str] = f"""
+                if ($isGitHubActions) {{
+                    # Annotations need no colors, so they are collected and written in one call
+                    $annotations = [System.Text.StringBuilder]::new()
+                    foreach ($issue in $issues) {{{_GITHUB_ACTIONS_OUTPUT.rstrip()}
+                    }}
+                    [Console]::Out.Write($annotations.ToString())
+                }} else {{
+                    foreach ($issue in $issues) {{
+                        $fileName = [System.IO.Path]::GetFileName($issue.ScriptName)
+                        $location = "$($fileName): Line $($issue.Line):1"
+{_TERMINAL_OUTPUT.rstrip()}
                     }}
                 }}
                 Write-Host "Found $($issues.Count) issue(s)" -ForegroundColor Yellow
     """
 
+# PowerShell code for text output of the analysis results
+_TEXT_OUTPUT_CODE: Final[str] = f"""
+            if ($issues.Count -gt 0) {{
+                Write-Host ""
+
+                # Check if running in GitHub Actions
+                $isGitHubActions = $env:GITHUB_ACTIONS -eq "true"
+{_ISSUE_REPORTING}
+                exit 1
+            }} else {{
+                Write-Host "No issues found" -ForegroundColor Green
+                exit 0
+            }}"""
+
+# PowerShell code for JSON output of the analysis results
+_JSON_OUTPUT_CODE: Final[str] = """
+            # Write one compressed JSON record per line so results can be parsed as they are read. ConvertTo-Json
+            # silently truncates objects nested deeper than -Depth, so use the maximum that Windows PowerShell allows.
+            # The records are written to stdout directly rather than through the host's output formatting.
+            if ($issues.Count -gt 0) {
+                foreach ($issue in $issues) {
+                    [Console]::Out.WriteLine((ConvertTo-Json -InputObject $issue -Depth 100 -Compress))
+                }
+                exit 1
+            } else {
+                exit 0
+            }"""
+
+# Redirected output is written in the OEM code page on Windows, but the JSON records are read as UTF-8
+_UTF8_OUTPUT_ENCODING: Final[str] = """
+        [Console]::OutputEncoding = [System.Text.UTF8Encoding]::new($false)"""
 
-def _generate_error_handling() -> str:
-    """Generate PowerShell code for error handling."""
-    return """
+# PowerShell code for error handling
+_ERROR_HANDLING: Final[str] = """
         catch [System.IO.FileLoadException] {
             Write-Error "Assembly loading error: $($_.Exception.Message)"
             Write-Error "This may be due to .NET runtime compatibility issues."
@@ -109,6 +175,64 @@ def _generate_error_handling() -> str:
     """
 
 
+_WARNING_OR_ERROR_FILTER: Final[str] = """
+            # Filter to show only Warning and Error severity issues
+            $result = $result | Where-Object { $_.Severity -eq "Warning" -or $_.Severity -eq "Error" }"""
+
+# Invoke-ScriptAnalyzer parameter and result filter for each severity level
+_SEVERITY_OPTIONS: Final[dict[str, tuple[str, str]]] = {
+    # Show all issues including Information severity
+    "All": ("", ""),
+    "Information": ("", ""),
+    # Show only Warning and Error severity issues (default)
+    "Warning": ("", _WARNING_OR_ERROR_FILTER),
+    # Show only Error issues
+    "Error": ("-Severity Error", ""),
+}
+
+_INCLUDE_RULES_FILTER: Final[str] = """
+            # Filter to include only specific rules
+            $includeRules = [System.Collections.Generic.HashSet[string]]::new(
+                [string[]]@({rules}), [System.StringComparer]::OrdinalIgnoreCase)
+            $result = $result | Where-Object {{ $includeRules.Contains($_.RuleName) }}"""
+
+_EXCLUDE_RULES_FILTER: Final[str] = """
+            # Filter to exclude specific rules
+            $excludeRules = [System.Collections.Generic.HashSet[string]]::new(
+                [string[]]@({rules}), [System.StringComparer]::OrdinalIgnoreCase)
+            $result = $result | Where-Object {{ -not $excludeRules.Contains($_.RuleName) }}"""
+
+
+def _category_filter(description: str, rules: list[str], category: str, security: bool = False) -> str:
+    """Build the PowerShell code that keeps only the results of one rule category."""
+    rules_list = ", ".join(f"'{rule}'" for rule in rules)
+    properties = [f'-Name "RuleCategory" -Value "{category}"']
+    if security:
+        properties.insert(0, '-Name "IsSecurityRule" -Value $true')
+    members = "".join(
+        f"\n                $_ | Add-Member -MemberType NoteProperty {prop} -Force" for prop in properties
+    )
+    return f"""
+            # Filter to include only {description}
+            $categoryRules = [System.Collections.Generic.HashSet[string]]::new(
+                [string[]]@({rules_list}), [System.StringComparer]::OrdinalIgnoreCase)
+            $result = $result | Where-Object {{ $categoryRules.Contains($_.RuleName) }}
+            # Add category property to results for SARIF conversion
+            $result | ForEach-Object {{{members}
+            }}"""
+
+
+# Category filters in the order of generate_analysis_script's *_only arguments
+_CATEGORY_FILTERS: Final[tuple[str, ...]] = (
+    _category_filter("security-related rules", SECURITY_RULES, "Security", security=True),
+    _category_filter("style-related rules", STYLE_RULES, "Style"),
+    _category_filter("performance-related rules", PERFORMANCE_RULES, "Performance"),
+    _category_filter("best practices rules", BEST_PRACTICES_RULES, "BestPractices"),
+    _category_filter("DSC-related rules", DSC_RULES, "DSC"),
+    _category_filter("compatibility-related rules", COMPATIBILITY_RULES, "Compatibility"),
+)
+
+
 def generate_analysis_script(
     files_param: str,
     severity: str = "Warning",
@@ -118,141 +242,56 @@ def generate_analysis_script(
     best_practices_only: bool = False,
     dsc_only: bool = False,
     compatibility_only: bool = False,
-    include_rules: Optional[list[str]] = None,
-    exclude_rules: Optional[list[str]] = None,
+    include_rules: Optional[Collection[str]] = None,
+    exclude_rules: Optional[Collection[str]] = None,
     json_output: bool = False,
 ) -> str:
     """Generate PowerShell script to analyze PowerShell files."""
-    from .constants import (
-        BEST_PRACTICES_RULES,
-        COMPATIBILITY_RULES,
-        DSC_RULES,
-        PERFORMANCE_RULES,
-        SECURITY_RULES,
-        STYLE_RULES,
+    # The rule lists are passed on as sorted tuples, which are hashable and independent of the caller's ordering
+    return _generate_analysis_script(
+        files_param,
+        severity,
+        security_only,
+        style_only,
+        performance_only,
+        best_practices_only,
+        dsc_only,
+        compatibility_only,
+        tuple(sorted(include_rules or ())),
+        tuple(sorted(exclude_rules or ())),
+        json_output,
     )
 
-    # Handle different severity levels
-    if severity == "All" or severity == "Information":
-        # Show all issues including Information severity
-        severity_param = ""
-        filter_logic = ""
-    elif severity == "Warning":
-        # Show only Warning and Error severity issues (default)
-        severity_param = ""
-        filter_logic = """
-                # Filter to show only Warning and Error severity issues
-                $result = $result | Where-Object { $_.Severity -eq "Warning" -or $_.Severity -eq "Error" }"""
-    elif severity == "Error":
-        # Show only Error issues
-        severity_param = "-Severity Error"
-        filter_logic = ""
-    else:
-        # Fallback to Warning behavior
-        severity_param = ""
-        filter_logic = """
-                # Filter to show only Warning and Error severity issues
-                $result = $result | Where-Object { $_.Severity -eq "Warning" -or $_.Severity -eq "Error" }"""
-
-    # Add rule category filtering if requested
-    rule_category_filter = ""
-
-    # Security rules filter
-    if security_only:
-        security_rules_list = ", ".join(f"'{rule}'" for rule in SECURITY_RULES)
-        rule_category_filter = f"""
-                # Filter to include only security-related rules
-                $categoryRules = @({security_rules_list})
-                $result = $result | Where-Object {{ $categoryRules -contains $_.RuleName }}
-                # Add category property to results for SARIF conversion
-                $result | ForEach-Object {{
-                    $_ | Add-Member -MemberType NoteProperty -Name "IsSecurityRule" -Value $true -Force
-                    $_ | Add-Member -MemberType NoteProperty -Name "RuleCategory" -Value "Security" -Force
-                }}
-        """
-
-    # Style rules filter
-    elif style_only:
-        style_rules_list = ", ".join(f"'{rule}'" for rule in STYLE_RULES)
-        rule_category_filter = f"""
-                # Filter to include only style-related rules
-                $categoryRules = @({style_rules_list})
-                $result = $result | Where-Object {{ $categoryRules -contains $_.RuleName }}
-                # Add category property to results for SARIF conversion
-                $result | ForEach-Object {{
-                    $_ | Add-Member -MemberType NoteProperty -Name "RuleCategory" -Value "Style" -Force
-                }}
-        """
-
-    # Performance rules filter
-    elif performance_only:
-        performance_rules_list = ", ".join(f"'{rule}'" for rule in PERFORMANCE_RULES)
-        rule_category_filter = f"""
-                # Filter to include only performance-related rules
-                $categoryRules = @({performance_rules_list})
-                $result = $result | Where-Object {{ $categoryRules -contains $_.RuleName }}
-                # Add category property to results for SARIF conversion
-                $result | ForEach-Object {{
-                    $_ | Add-Member -MemberType NoteProperty -Name "RuleCategory" -Value "Performance" -Force
-                }}
-        """
-
-    # Best practices rules filter
-    elif best_practices_only:
-        best_practices_rules_list = ", ".join(f"'{rule}'" for rule in BEST_PRACTICES_RULES)
-        rule_category_filter = f"""
-                # Filter to include only best practices rules
-                $categoryRules = @({best_practices_rules_list})
-                $result = $result | Where-Object {{ $categoryRules -contains $_.RuleName }}
-                # Add category property to results for SARIF conversion
-                $result | ForEach-Object {{
-                    $_ | Add-Member -MemberType NoteProperty -Name "RuleCategory" -Value "BestPractices" -Force
-                }}
-        """
-
-    # DSC rules filter
-    elif dsc_only:
-        dsc_rules_list = ", ".join(f"'{rule}'" for rule in DSC_RULES)
-        rule_category_filter = f"""
-                # Filter to include only DSC-related rules
-                $categoryRules = @({dsc_rules_list})
-                $result = $result | Where-Object {{ $categoryRules -contains $_.RuleName }}
-                # Add category property to results for SARIF conversion
-                $result | ForEach-Object {{
-                    $_ | Add-Member -MemberType NoteProperty -Name "RuleCategory" -Value "DSC" -Force
-                }}
-        """
-
-    # Compatibility rules filter
-    elif compatibility_only:
-        compatibility_rules_list = ", ".join(f"'{rule}'" for rule in COMPATIBILITY_RULES)
-        rule_category_filter = f"""
-                # Filter to include only compatibility-related rules
-                $categoryRules = @({compatibility_rules_list})
-                $result = $result | Where-Object {{ $categoryRules -contains $_.RuleName }}
-                # Add category property to results for SARIF conversion
-                $result | ForEach-Object {{
-                    $_ | Add-Member -MemberType NoteProperty -Name "RuleCategory" -Value "Compatibility" -Force
-                }}
-        """
+
+@functools.lru_cache(maxsize=64)
+def _generate_analysis_script(
+    files_param: str,
+    severity: str,
+    security_only: bool,
+    style_only: bool,
+    performance_only: bool,
+    best_practices_only: bool,
+    dsc_only: bool,
+    compatibility_only: bool,
+    include_rules: tuple[str, ...],
+    exclude_rules: tuple[str, ...],
+    json_output: bool,
+) -> str:
+    """Generate the analysis script for one combination of options; see ``generate_analysis_script``."""
+    # Handle different severity levels; anything unknown falls back to Warning behavior
+    severity_param, filter_logic = _SEVERITY_OPTIONS.get(severity, _SEVERITY_OPTIONS["Warning"])
+
+    # Add rule category filtering if requested; the first selected category wins
+    flags = (security_only, style_only, performance_only, best_practices_only, dsc_only, compatibility_only)
+    rule_category_filter = next((code for flag, code in zip(flags, _CATEGORY_FILTERS) if flag), "")
 
     # Include/exclude specific rules if specified
     include_exclude_filter = ""
     if include_rules:
-        include_rules_list = ", ".join(f"'{rule}'" for rule in include_rules)
-        include_exclude_filter = f"""
-                # Filter to include only specific rules
-                $includeRules = @({include_rules_list})
-                $result = $result | Where-Object {{ $includeRules -contains $_.RuleName }}
-        """
+        include_exclude_filter = _INCLUDE_RULES_FILTER.format(rules=", ".join(f"'{rule}'" for rule in include_rules))
 
     if exclude_rules:
-        exclude_rules_list = ", ".join(f"'{rule}'" for rule in exclude_rules)
-        include_exclude_filter = f"""
-                # Filter to exclude specific rules
-                $excludeRules = @({exclude_rules_list})
-                $result = $result | Where-Object {{ $excludeRules -notcontains $_.RuleName }}
-        """
+        include_exclude_filter = _EXCLUDE_RULES_FILTER.format(rules=", ".join(f"'{rule}'" for rule in exclude_rules))
 
     # Combine all filters
     if rule_category_filter:
@@ -262,43 +301,33 @@ def generate_analysis_script(
         filter_logic += include_exclude_filter
 
     # Choose output format
-    if json_output:
-        output_code = """
-            # Convert to JSON format
-            if ($issues.Count -gt 0) {
-                $issues | ConvertTo-Json -Depth 4
-                exit 1
-            } else {
-                Write-Host ""
-                exit 0
-            }"""
-    else:
-        issue_reporting = _generate_issue_reporting_logic()
-        output_code = f"""
-            if ($issues.Count -gt 0) {{
-                Write-Host ""
-
-                # Check if running in GitHub Actions
-                $isGitHubActions = $env:GITHUB_ACTIONS -eq "true"
-{issue_reporting}
-                exit 1
-            }} else {{
-                Write-Host "No issues found" -ForegroundColor Green
-                exit 0
-            }}"""
+    output_code = _JSON_OUTPUT_CODE if json_output else _TEXT_OUTPUT_CODE
+    output_encoding = _UTF8_OUTPUT_ENCODING if json_output else ""
 
-    error_handling = _generate_error_handling()
+    # Without a severity parameter the command must not end in the blank that separates it
+    analyzer_command = f"Invoke-ScriptAnalyzer {severity_param}".rstrip()
 
-    return f"""
+    return _dedent(f"""{output_encoding}
         try {{
             $files = @({files_param})
             $issues = @()
-            foreach ($file in $files) {{
-                $result = Invoke-ScriptAnalyzer -Path $file {severity_param}{filter_logic}
-                if ($result) {{
-                    $issues += $result
+            if ($PSVersionTable.PSVersion.Major -ge 7 -and $files.Count -ge {PARALLEL_ANALYSIS_MIN_FILES}) {{
+                # Deal the files into one batch per core and analyze the batches in parallel runspaces
+                $batchCount = [Math]::Min([Environment]::ProcessorCount, $files.Count)
+                $batches = for ($i = 0; $i -lt $batchCount; $i++) {{
+                    ,@(for ($j = $i; $j -lt $files.Count; $j += $batchCount) {{ $files[$j] }})
                 }}
+                $result = $batches | ForEach-Object -Parallel {{
+                    $_ | {analyzer_command}
+                }} -ThrottleLimit $batchCount
+            }} else {{
+                # Pipe every file through one Invoke-ScriptAnalyzer call so rules are loaded only once
+                $result = $files | {analyzer_command}
+            }}{filter_logic}
+
+            if ($result) {{
+                $issues = @($result)
             }}
 {output_code}
-        }} {error_handling}
-        """
+        }}{_ERROR_HANDLING}
+        """)
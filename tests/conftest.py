@@ -0,0 +1,63 @@
+"""Shared pytest fixtures."""
+
+import argparse
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Point the environment cache at an empty directory so tests never share detected PowerShell state."""
+    cache_home = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    monkeypatch.delenv("PSSA_NO_CACHE", raising=False)
+    return cache_home
+
+
+@pytest.fixture(scope="session")
+def base_parser() -> argparse.ArgumentParser:
+    """Build the command-line parser once per session; parsing arguments does not modify it."""
+    from py_psscriptanalyzer import cli
+
+    return cli.create_parser()
+
+
+@pytest.fixture(scope="session")
+def ps_sample_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Create a directory of PowerShell and other files once per session; tests must not modify it."""
+    sample_dir = tmp_path_factory.mktemp("ps")
+    (sample_dir / "foo.ps1").write_text("# Test PowerShell file")
+    (sample_dir / "bar.psm1").write_text("")
+    (sample_dir / "baz.txt").write_text("")
+    return sample_dir
+
+
+@pytest.fixture
+def stub_powershell_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Make the CLI find PowerShell as ``pwsh`` with PSScriptAnalyzer already installed."""
+    from py_psscriptanalyzer import cli
+
+    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
+    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+
+
+@pytest.fixture
+def status_messages(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Record the messages passed to ``cli.print_status`` instead of printing them."""
+    from py_psscriptanalyzer import cli
+
+    messages: list[str] = []
+    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": messages.append(msg))
+    return messages
+
+
+@pytest.fixture
+def mock_analysis_script(monkeypatch: pytest.MonkeyPatch) -> MagicMock:
+    """Replace the analysis script generator used by ``run_script_analyzer`` with a mock returning a stub script."""
+    from py_psscriptanalyzer import core
+
+    mock = MagicMock(return_value="mock script")
+    monkeypatch.setattr(core, "generate_analysis_script", mock)
+    return mock
@@ -0,0 +1,101 @@
+"""Tests for py_psscriptanalyzer._cache module."""
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from py_psscriptanalyzer import __version__, _cache, cli
+from py_psscriptanalyzer.constants import ENVIRONMENT_CACHE_TTL
+
+
+@pytest.fixture
+def cache_file(isolated_cache: Path) -> Path:
+    """Path of the environment cache file inside the isolated cache directory."""
+    return isolated_cache / "py-psscriptanalyzer" / "env.json"
+
+
+@pytest.fixture
+def pwsh(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A stand-in PowerShell executable that ``pwsh`` resolves to on PATH."""
+    executable = tmp_path / "pwsh"
+    executable.write_text("")
+    monkeypatch.setattr(_cache.shutil, "which", lambda cmd: str(executable) if cmd == "pwsh" else None)
+    return executable
+
+
+class TestEnvironmentCache:
+    """Tests for loading and saving the detected PowerShell environment."""
+
+    def test_round_trip(self, cache_file: Path, pwsh: Path) -> None:
+        """Test that a saved command is loaded back while it still resolves to the same executable."""
+        _cache.save_powershell("pwsh")
+        assert json.loads(cache_file.read_text()) == {
+            "version": __version__,
+            "powershell": "pwsh",
+            "executable": [str(pwsh), pwsh.stat().st_mtime_ns],
+        }
+        assert _cache.load_powershell() == "pwsh"
+
+    def test_missing_file(self, pwsh: Path) -> None:
+        """Test that there is no cached command before anything is saved."""
+        assert _cache.load_powershell() is None
+
+    def test_executable_removed(self, pwsh: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the entry is ignored once the executable is no longer on PATH."""
+        _cache.save_powershell("pwsh")
+        monkeypatch.setattr(_cache.shutil, "which", lambda cmd: None)
+        assert _cache.load_powershell() is None
+
+    def test_executable_updated(self, pwsh: Path) -> None:
+        """Test that the entry is ignored once the executable has been replaced, e.g. by an upgrade."""
+        _cache.save_powershell("pwsh")
+        mtime = pwsh.stat().st_mtime - 60
+        os.utime(pwsh, (mtime, mtime))
+        assert _cache.load_powershell() is None
+
+    def test_version_mismatch(self, cache_file: Path, pwsh: Path) -> None:
+        """Test that entries written by another version of the package are ignored."""
+        _cache.save_powershell("pwsh")
+        data = json.loads(cache_file.read_text())
+        cache_file.write_text(json.dumps({**data, "version": "0.0.0"}))
+        assert _cache.load_powershell() is None
+
+    def test_expired(self, cache_file: Path, pwsh: Path) -> None:
+        """Test that entries older than the TTL are ignored."""
+        _cache.save_powershell("pwsh")
+        stale = cache_file.stat().st_mtime - ENVIRONMENT_CACHE_TTL - 1
+        os.utime(cache_file, (stale, stale))
+        assert _cache.load_powershell() is None
+
+    def test_corrupt_file(self, cache_file: Path) -> None:
+        """Test that an unreadable cache file is treated as a miss."""
+        cache_file.parent.mkdir(parents=True)
+        cache_file.write_text("{not json")
+        assert _cache.load_powershell() is None
+
+    def test_disabled(self, cache_file: Path, pwsh: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that PSSA_NO_CACHE turns the cache off."""
+        monkeypatch.setenv("PSSA_NO_CACHE", "1")
+        _cache.save_powershell("pwsh")
+        assert not cache_file.exists()
+
+
+def test_main_uses_cached_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that main skips the PowerShell probes when the cache has a usable entry."""
+    monkeypatch.setattr(_cache, "load_powershell", lambda: "pwsh")
+    monkeypatch.setattr(cli, "find_powershell", lambda: pytest.fail("find_powershell called"))
+    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: pytest.fail("module check called"))
+    monkeypatch.setattr(cli, "run_script_analyzer", lambda cmd, files, **kwargs: 0)
+    assert cli.main(["script.ps1"]) == 0
+
+
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_saves_detected_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that main records the environment once PSScriptAnalyzer is confirmed available."""
+    saved = []
+    monkeypatch.setattr(_cache, "save_powershell", saved.append)
+    monkeypatch.setattr(cli, "run_script_analyzer", lambda cmd, files, **kwargs: 0)
+    assert cli.main(["script.ps1"]) == 0
+    assert saved == ["pwsh"]
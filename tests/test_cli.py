@@ -7,13 +7,18 @@ This file contains all tests for the CLI functionality, including:
 - Error handling scenarios
 """
 
+import argparse
 import os
+import subprocess
+import sys
 from pathlib import Path
-from unittest.mock import patch
+from typing import Optional
 
 import pytest
 
 from py_psscriptanalyzer import cli
+from py_psscriptanalyzer.constants import RuleFilter
+from py_psscriptanalyzer.scripts import generate_analysis_script
 
 
 def test_get_default_severity_env(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -40,9 +45,14 @@ def test_print_status_and_error(capsys: pytest.CaptureFixture[str]) -> None:
     assert "Test status" in out or "Test error" in out
 
 
-def test_create_parser_help() -> None:
-    parser = cli.create_parser()
-    help_text = parser.format_help()
+def test_print_status_does_not_parse_markup(capsys: pytest.CaptureFixture[str]) -> None:
+    cli.print_status("Analyzing [bold]legacy[/bold].ps1", style="blue")
+    out = capsys.readouterr().out
+    assert "[bold]legacy[/bold].ps1" in out
+
+
+def test_create_parser_help(base_parser: argparse.ArgumentParser) -> None:
+    help_text = base_parser.format_help()
     assert "usage" in help_text.lower()
     assert "--help" in help_text
 
@@ -59,11 +69,22 @@ def test_rich_help_formatter_output() -> None:
     assert "USAGE" in help_text
     assert "OPTIONS" in help_text
     assert "EXAMPLES" in help_text
+    assert "[OPTIONS] [FILES...]" in help_text
+
+
+def test_rich_help_formatter_renders_once() -> None:
+    from py_psscriptanalyzer import _help
+
+    _help._render_help.cache_clear()
+    first = cli.RichHelpFormatter(prog="test").format_help()
+    second = cli.RichHelpFormatter(prog="test").format_help()
+    assert first == second
+    assert _help._render_help.cache_info().misses == 1
 
 
 # Optionally, more tests can be added for argument parsing, e.g.:
-def test_parser_parses_version() -> None:
-    parser = cli.create_parser()
+def test_parser_parses_version(base_parser: argparse.ArgumentParser) -> None:
+    parser = base_parser
     args = parser.parse_args(["--version"])
     assert hasattr(args, "version")
 
@@ -80,63 +101,81 @@ def test_find_powershell_files_recursive_empty(
 
 def test_find_powershell_files_recursive_with_files(
     monkeypatch: pytest.MonkeyPatch,
-    tmp_path: Path,
+    ps_sample_dir: Path,
 ) -> None:
-    # Create some PowerShell files
-    (tmp_path / "foo.ps1").write_text("")
-    (tmp_path / "bar.psm1").write_text("")
-    (tmp_path / "baz.txt").write_text("")
-    monkeypatch.chdir(tmp_path)
-    files = cli.find_powershell_files_recursive()
+    monkeypatch.chdir(ps_sample_dir)
     files = cli.find_powershell_files_recursive()
     assert any(f.endswith(".ps1") for f in files)
     assert any(f.endswith(".psm1") for f in files)
     assert not any(f.endswith(".txt") for f in files)
 
 
+def test_import_does_not_load_subprocess() -> None:
+    """Importing the CLI must not pull in subprocess; hook runs with no PowerShell files never need it."""
+    code = "import sys, py_psscriptanalyzer.cli; print('subprocess' in sys.modules)"
+    src_dir = str(Path(cli.__file__).parents[1])
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    assert result.stdout.strip() == "False"
+
+
 def test_print_success(capsys: pytest.CaptureFixture[str]) -> None:
     cli.print_success("Yay!")
     out = capsys.readouterr().out
     assert "OK" in out or "Yay!" in out
 
 
-def test_main_version(monkeypatch: pytest.MonkeyPatch) -> None:
-    # Patch console.print to capture output
-    called = {}
+@pytest.mark.parametrize("flag", ["--version", "-v"])
+def test_main_version(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], flag: str) -> None:
+    # A lone version flag must need neither the Rich console nor the parser
+    monkeypatch.setattr(cli, "_console", lambda: pytest.fail("console used for --version"))
+    monkeypatch.setattr(cli, "create_parser", lambda: pytest.fail("parser built for --version"))
+    ret = cli.main([flag])
+    assert ret == 0
+    assert "py-psscriptanalyzer" in capsys.readouterr().out
 
-    def fake_print(msg, *a, **k):
-        called["msg"] = msg
 
-    monkeypatch.setattr(cli.console, "print", fake_print)
-    parser = cli.create_parser()
-    parser.parse_args(["--version"])
-    # Patch create_parser to return our parser
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-    ret = cli.main(["--version"])
+def test_main_version_with_other_arguments(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], base_parser: argparse.ArgumentParser
+) -> None:
+    # Combined with other arguments, --version still goes through argument parsing
+    monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
+    ret = cli.main(["--severity", "Error", "--version", "script.ps1"])
     assert ret == 0
-    assert "py-psscriptanalyzer" in called["msg"]
+    assert "py-psscriptanalyzer" in capsys.readouterr().out
 
 
-def test_main_recursive_no_files(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_main_recursive_no_files(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     # Patch find_powershell_files_recursive to return []
     monkeypatch.setattr(cli, "find_powershell_files_recursive", lambda: [])
-    parser = cli.create_parser()
-    parser.parse_args(["--recursive"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-    # Patch print_status to record all calls
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
+    monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
     ret = cli.main(["--recursive"])
     assert ret == 0
     assert "No PowerShell files found" in status_messages
 
 
-def test_main_no_files(monkeypatch: pytest.MonkeyPatch) -> None:
-    parser = cli.create_parser()
-    parser.parse_args([])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_deduplicates_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a file passed more than once is only analyzed once and that extensions match in any case."""
+    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": None)
+    monkeypatch.setattr(cli, "print_success", lambda msg: None)
+    called = {}
+
+    def mock_run_script_analyzer(cmd, files, **kwargs):
+        called["files"] = files
+        return 0
+
+    monkeypatch.setattr(cli, "run_script_analyzer", mock_run_script_analyzer)
+    assert cli.main(["b.ps1", "a.psm1", "b.ps1", "notes.txt", "Setup.PS1"]) == 0
+    assert called["files"] == ["b.ps1", "a.psm1", "Setup.PS1"]
+
+
+def test_main_no_files(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
+    monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
     ret = cli.main([])
     assert ret == 0
     assert "No PowerShell files specified" in status_messages
@@ -148,91 +187,48 @@ def test_main_no_files(monkeypatch: pytest.MonkeyPatch) -> None:
 #
 # Tests from test_cli_additional.py
 #
-def test_main_with_mixed_files(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_mixed_files(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     """Test when a mixture of PowerShell and non-PowerShell files are provided."""
-    parser = cli.create_parser()
-    parser.parse_args(["script.ps1", "file.txt", "module.psm1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-    # Mock function calls for PowerShell detection and script analyzer
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+    # Mock the script analyzer
     monkeypatch.setattr(
         cli,
         "run_script_analyzer",
-        lambda cmd,
-        files,
-        format_files=False,
-        severity="Warning",
-        security_only=False,
-        style_only=False,
-        performance_only=False,
-        best_practices_only=False,
-        dsc_only=False,
-        compatibility_only=False,
-        include_rules=None,
-        exclude_rules=None,
-        output_format="text",
-        output_file=None: 0,
+        lambda cmd, files, **kwargs: 0,
     )
 
-    # Capture status messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
-
     # Capture success messages
     success_messages = []
     monkeypatch.setattr(cli, "print_success", lambda msg: success_messages.append(msg))
 
-    ret = cli.main(["script.ps1", "file.txt", "module.psm1"])
+    ret = cli._dispatch(base_parser.parse_args(["script.ps1", "file.txt", "module.psm1"]))
     assert ret == 0
     assert "No issues found" in success_messages
 
 
-def test_main_with_format_option(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_format_option(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     """Test with format option enabled."""
-    parser = cli.create_parser()
-    parser.parse_args(["--format", "script.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-    # Mock function calls
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
     monkeypatch.setattr(
         cli,
         "run_script_analyzer",
-        lambda cmd,
-        files,
-        format_files=True,
-        severity="Warning",
-        security_only=False,
-        style_only=False,
-        performance_only=False,
-        best_practices_only=False,
-        dsc_only=False,
-        compatibility_only=False,
-        include_rules=None,
-        exclude_rules=None,
-        output_format="text",
-        output_file=None: 0,
+        lambda cmd, files, **kwargs: 0,
     )
 
-    # Capture status messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
-
-    ret = cli.main(["--format", "script.ps1"])
+    ret = cli._dispatch(base_parser.parse_args(["--format", "script.ps1"]))
     assert ret == 0
     # Should have "Formatting" in one of the status messages
     assert any("Formatting" in msg for msg in status_messages)
 
 
-def test_main_psscriptanalyzer_install_success(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_main_psscriptanalyzer_install_success(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser
+) -> None:
     """Test the path where PSScriptAnalyzer is not installed but gets installed successfully."""
-    parser = cli.create_parser()
-    parser.parse_args(["script.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
     # Mock function calls
     monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
     monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: False)
@@ -240,27 +236,14 @@ def test_main_psscriptanalyzer_install_success(monkeypatch: pytest.MonkeyPatch)
     monkeypatch.setattr(
         cli,
         "run_script_analyzer",
-        lambda cmd,
-        files,
-        format_files=False,
-        severity="Warning",
-        security_only=False,
-        style_only=False,
-        performance_only=False,
-        best_practices_only=False,
-        dsc_only=False,
-        compatibility_only=False,
-        include_rules=None,
-        exclude_rules=None,
-        output_format="text",
-        output_file=None: 0,
+        lambda cmd, files, **kwargs: 0,
     )
 
     # Capture success messages
     success_messages = []
     monkeypatch.setattr(cli, "print_success", lambda msg: success_messages.append(msg))
 
-    ret = cli.main(["script.ps1"])
+    ret = cli._dispatch(base_parser.parse_args(["script.ps1"]))
     assert ret == 0
     assert "PSScriptAnalyzer installed successfully" in success_messages
 
@@ -268,86 +251,49 @@ def test_main_psscriptanalyzer_install_success(monkeypatch: pytest.MonkeyPatch)
 #
 # Tests from test_cli_more.py
 #
-def test_main_script_analyzer_with_issues(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_script_analyzer_with_issues(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     """Test when script analyzer finds issues (returns non-zero)."""
-    parser = cli.create_parser()
-    parser.parse_args(["script.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
+    monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
 
-    # Mock function calls
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
     # Return 1 to indicate issues found
     monkeypatch.setattr(
         cli,
         "run_script_analyzer",
-        lambda cmd,
-        files,
-        format_files=False,
-        severity="Warning",
-        security_only=False,
-        style_only=False,
-        performance_only=False,
-        best_practices_only=False,
-        dsc_only=False,
-        compatibility_only=False,
-        include_rules=None,
-        exclude_rules=None,
-        output_format="text",
-        output_file=None: 1,
+        lambda cmd, files, **kwargs: 1,
     )
 
     # Capture output messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
 
     ret = cli.main(["script.ps1"])
     assert ret == 1
     # Should not have "No issues found" in success messages because we mocked issues being found
 
 
+@pytest.mark.usefixtures("stub_powershell_env")
 def test_main_with_real_files(
     monkeypatch: pytest.MonkeyPatch,
-    tmp_path: Path,
+    ps_sample_dir: Path,
 ) -> None:
     """Test with real PowerShell files."""
-    # Create a PowerShell file in a temporary directory
-    ps1_path = tmp_path / "test.ps1"
-    # Create a PowerShell file in a temporary directory
-    ps1_path = tmp_path / "test.ps1"
-    ps1_path.write_text("# Test PowerShell file")
-
     # Mock function calls but use the real find_powershell_files_recursive
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
     monkeypatch.setattr(
         cli,
         "run_script_analyzer",
-        lambda cmd,
-        files,
-        format_files=False,
-        severity="Warning",
-        security_only=False,
-        style_only=False,
-        performance_only=False,
-        best_practices_only=False,
-        dsc_only=False,
-        compatibility_only=False,
-        include_rules=None,
-        exclude_rules=None,
-        output_format="text",
-        output_file=None: 0,
-    )  # Run with recursive option from the tmp_path
+        lambda cmd, files, **kwargs: 0,
+    )  # Run with recursive option from the sample directory
     with monkeypatch.context() as m:
-        m.chdir(tmp_path)
+        m.chdir(ps_sample_dir)
         ret = cli.main(["--recursive"])
         assert ret == 0
 
 
-def test_parser_all_options() -> None:
+def test_parser_all_options(base_parser: argparse.ArgumentParser) -> None:
     """Test all options in the parser."""
     # Test all options in the parser
-    parser = cli.create_parser()
+    parser = base_parser
     args = parser.parse_args(
         [
             "--recursive",
@@ -377,52 +323,164 @@ def test_parser_all_options() -> None:
 #
 def test_get_version_import_error(monkeypatch: pytest.MonkeyPatch) -> None:
     """Test the _get_version_display function with an ImportError."""
+    import py_psscriptanalyzer
 
-    # Use monkeypatch to make the import statement raise ImportError
-    def mock_import(*args, **kwargs):
-        raise ImportError("Simulated import error")
+    # Without the attribute, "from . import __version__" raises ImportError
+    monkeypatch.delattr(py_psscriptanalyzer, "__version__")
 
-    # Temporarily modify the built-in __import__ function
-    monkeypatch.setattr("builtins.__import__", mock_import)
-
-    # Execute the function, which should now hit the ImportError case
-    version = cli._get_version_display()
+    # The result is memoized, so drop any value cached by earlier calls
+    cli._get_version_display.cache_clear()
+    try:
+        version = cli._get_version_display()
+    finally:
+        cli._get_version_display.cache_clear()
 
     # Verify the fallback message is returned
     assert version == "py-psscriptanalyzer (unknown version)"
 
 
-def test_find_powershell_files_default_dir(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_find_powershell_files_default_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
     """Test finding PowerShell files with default start directory."""
-    with patch("py_psscriptanalyzer.cli.Path.cwd") as mock_cwd, patch("py_psscriptanalyzer.cli.Path.glob") as mock_glob:
-        mock_cwd.return_value = Path("/fake/dir")
-        mock_glob.return_value = [Path("/fake/dir/test.ps1")]
+    (tmp_path / "test.ps1").write_text("")
+    monkeypatch.setattr(cli.Path, "cwd", lambda: tmp_path)
 
-        files = cli.find_powershell_files_recursive()
-        assert mock_cwd.called
-        assert len(files) > 0
+    files = cli.find_powershell_files_recursive()
+    assert files == [str(tmp_path / "test.ps1")]
 
 
-def test_main_no_files_no_recursive(monkeypatch: pytest.MonkeyPatch) -> None:
-    """Test the main function with no files and not recursive."""
-    parser = cli.create_parser()
-    parser.parse_args([])  # Empty args
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
+def test_find_powershell_files_recursive_nested(tmp_path: Path) -> None:
+    """Test that files in nested directories are found and returned sorted."""
+    nested = tmp_path / "src" / "module"
+    nested.mkdir(parents=True)
+    (nested / "Module.psm1").write_text("")
+    (nested / "Module.psd1").write_text("")
+    (tmp_path / "build.ps1").write_text("")
+    (tmp_path / "src" / "notes.md").write_text("")
 
-    # Capture status messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
+    files = cli.find_powershell_files_recursive(tmp_path)
+    assert files == sorted(
+        [
+            str(tmp_path / "build.ps1"),
+            str(nested / "Module.psm1"),
+            str(nested / "Module.psd1"),
+        ]
+    )
 
-    ret = cli.main([])
-    assert ret == 0
-    assert "No PowerShell files specified" in status_messages
 
+def test_find_powershell_files_recursive_dir_with_ps_suffix(tmp_path: Path) -> None:
+    """Test that a directory whose name ends in a PowerShell extension is descended, not returned."""
+    odd_dir = tmp_path / "tools.ps1"
+    odd_dir.mkdir()
+    (odd_dir / "inner.ps1").write_text("")
+
+    files = cli.find_powershell_files_recursive(tmp_path)
+    assert files == [str(odd_dir / "inner.ps1")]
+
+
+def test_find_powershell_files_recursive_prunes_directories(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """Test that well-known and user-configured directories are not descended."""
+    monkeypatch.setenv("PSSA_PRUNE_DIRS", os.pathsep.join(["vendor", ""]))
+    for name in (".git", "node_modules", "vendor", "src"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "script.ps1").write_text("")
+
+    files = cli.find_powershell_files_recursive(tmp_path)
+    assert files == [str(tmp_path / "src" / "script.ps1")]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="symlinks not supported")
+def test_find_powershell_files_recursive_walkers_agree(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """Test that the os.fwalk and os.scandir walkers find the same regular files and skip symlinks."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "module.psm1").write_text("")
+    (tmp_path / "src" / "LEGACY.PS1").write_text("")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "skip.ps1").write_text("")
+    try:
+        (tmp_path / "link.ps1").symlink_to(tmp_path / "src" / "module.psm1")
+        (tmp_path / "linked_dir").symlink_to(tmp_path / "src", target_is_directory=True)
+    except OSError:
+        pytest.skip("cannot create symlinks")
+
+    expected = [str(tmp_path / "src" / "LEGACY.PS1"), str(tmp_path / "src" / "module.psm1")]
+    assert cli.find_powershell_files_recursive(tmp_path) == expected
+    monkeypatch.delattr(os, "fwalk", raising=False)
+    assert cli.find_powershell_files_recursive(tmp_path) == expected
+
+
+@pytest.mark.skipif(not hasattr(os, "fwalk"), reason="os.fwalk not available")
+def test_find_powershell_files_recursive_file_removed_during_walk(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """Test that a file removed between listing its directory and checking its type is skipped."""
+    (tmp_path / "gone.ps1").write_text("")
+    (tmp_path / "kept.ps1").write_text("")
+    real_stat = os.stat
+
+    def stat_after_removal(path, *args, **kwargs):
+        if path == "gone.ps1":
+            (tmp_path / "gone.ps1").unlink()
+        return real_stat(path, *args, **kwargs)
 
-def test_main_powershell_not_found(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(os, "stat", stat_after_removal)
+    assert cli.find_powershell_files_recursive(tmp_path) == [str(tmp_path / "kept.ps1")]
+
+
+def test_main_recursive_probes_powershell_during_walk(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that PowerShell detection runs while the tree is being walked in recursive mode."""
+    import threading
+
+    probing = threading.Event()
+
+    def fake_find_powershell():
+        probing.set()
+        return "pwsh"
+
+    def fake_walk():
+        # Only returns files once the probe has started alongside the walk
+        assert probing.wait(timeout=5)
+        return ["a.ps1"]
+
+    called = {}
+
+    def mock_run_script_analyzer(cmd, files, **kwargs):
+        called.update(cmd=cmd, files=files)
+        return 0
+
+    monkeypatch.setattr(cli, "find_powershell", fake_find_powershell)
+    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+    monkeypatch.setattr(cli, "find_powershell_files_recursive", fake_walk)
+    monkeypatch.setattr(cli, "run_script_analyzer", mock_run_script_analyzer)
+    assert cli.main(["--recursive"]) == 0
+    assert called == {"cmd": "pwsh", "files": ["a.ps1"]}
+
+
+def test_main_recursive_no_files_does_not_wait_for_probe(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a recursive run without files returns while PowerShell detection is still running."""
+    import threading
+
+    release = threading.Event()
+
+    def slow_find_powershell():
+        release.wait(timeout=5)
+        return "pwsh"
+
+    monkeypatch.setattr(cli, "find_powershell", slow_find_powershell)
+    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+    monkeypatch.setattr(cli, "find_powershell_files_recursive", lambda: [])
+    try:
+        assert cli.main(["--recursive"]) == 0
+        # The probe is still running, and must not keep the interpreter alive at exit
+        probes = [thread for thread in threading.enumerate() if thread.name == "powershell-probe"]
+        assert probes
+        assert all(thread.daemon for thread in probes)
+    finally:
+        release.set()
+
+
+def test_main_powershell_not_found(monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser) -> None:
     """Test the main function when PowerShell is not found."""
-    parser = cli.create_parser()
-    parser.parse_args(["file.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
+    monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
 
     # Mock powershell not found
     monkeypatch.setattr(cli, "find_powershell", lambda: None)
@@ -436,11 +494,11 @@ def test_main_powershell_not_found(monkeypatch: pytest.MonkeyPatch) -> None:
     assert "PowerShell not found" in error_messages[0]
 
 
-def test_main_psscriptanalyzer_install_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_main_psscriptanalyzer_install_fails(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser
+) -> None:
     """Test the main function when PSScriptAnalyzer installation fails."""
-    parser = cli.create_parser()
-    parser.parse_args(["file.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
+    monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
 
     # Mock function calls
     monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
@@ -457,9 +515,11 @@ def test_main_psscriptanalyzer_install_fails(monkeypatch: pytest.MonkeyPatch) ->
 
 
 # Rule category filters tests
-def test_parser_with_rule_category_filters(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_parser_with_rule_category_filters(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser
+) -> None:
     """Test the command-line parser with the new rule category filter arguments."""
-    parser = cli.create_parser()
+    parser = base_parser
 
     # Test with all rule category filters
     args = parser.parse_args(
@@ -484,9 +544,9 @@ def test_parser_with_rule_category_filters(monkeypatch: pytest.MonkeyPatch) -> N
     assert args.files == ["script.ps1"]
 
 
-def test_parser_with_include_exclude_rules() -> None:
+def test_parser_with_include_exclude_rules(base_parser: argparse.ArgumentParser) -> None:
     """Test the command-line parser with include and exclude rules arguments."""
-    parser = cli.create_parser()
+    parser = base_parser
 
     # Test with include rules
     args = parser.parse_args(["--include-rules", "Rule1,Rule2,Rule3", "script.ps1"])
@@ -501,47 +561,35 @@ def test_parser_with_include_exclude_rules() -> None:
     assert args.exclude_rules == "Rule4,Rule5"
 
 
-def test_main_with_style_filter(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_style_filter(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     """Test main function with style filter."""
-    parser = cli.create_parser()
-    parser.parse_args(["--style-only", "script.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-    # Mock function calls
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
 
     # Mock run_script_analyzer to verify arguments
     called = {}
 
     def mock_run_script_analyzer(cmd, files, **kwargs):
-        called["style_only"] = kwargs.get("style_only", False)
+        called["rule_filter"] = kwargs.get("rule_filter")
         return 0
 
     monkeypatch.setattr(cli, "run_script_analyzer", mock_run_script_analyzer)
 
-    # Capture status messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
+    cli._dispatch(base_parser.parse_args(["--style-only", "script.ps1"]))
 
-    cli.main(["--style-only", "script.ps1"])
-
-    # Verify style_only parameter was set to True
-    assert called["style_only"] is True
+    # Verify the style category was selected
+    assert called["rule_filter"] == RuleFilter.STYLE
 
     # Verify the correct status message was shown
     assert any("(style rules only)" in msg for msg in status_messages)
 
 
-def test_main_with_include_rules(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_include_rules(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     """Test main function with include rules."""
-    parser = cli.create_parser()
-    parser.parse_args(["--include-rules", "Rule1,Rule2", "script.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-    # Mock function calls
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
 
     # Mock run_script_analyzer to verify arguments
     called = {}
@@ -552,147 +600,106 @@ def test_main_with_include_rules(monkeypatch: pytest.MonkeyPatch) -> None:
 
     monkeypatch.setattr(cli, "run_script_analyzer", mock_run_script_analyzer)
 
-    # Capture status messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
-
-    cli.main(["--include-rules", "Rule1,Rule2", "script.ps1"])
+    cli._dispatch(base_parser.parse_args(["--include-rules", "Rule1,Rule2", "script.ps1"]))
 
     # Verify include_rules parameter contains the correct rules
-    assert called["include_rules"] == ["Rule1", "Rule2"]
+    assert called["include_rules"] == frozenset({"Rule1", "Rule2"})
 
     # Verify the correct status message was shown
     assert any("(specific included rules)" in msg for msg in status_messages)
 
 
-def test_main_with_multiple_category_filters(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_multiple_category_filters(
+    monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser, status_messages: list[str]
+) -> None:
     """Test main function with multiple category filters (only first should be used)."""
-    parser = cli.create_parser()
-    parser.parse_args(["--security-only", "--style-only", "--performance-only", "script.ps1"])
-    monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-    # Mock function calls
-    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
 
     # Mock run_script_analyzer to verify arguments
     called = {}
 
     def mock_run_script_analyzer(cmd, files, **kwargs):
-        called["security_only"] = kwargs.get("security_only", False)
-        called["style_only"] = kwargs.get("style_only", False)
-        called["performance_only"] = kwargs.get("performance_only", False)
+        called["rule_filter"] = kwargs.get("rule_filter")
         return 0
 
     monkeypatch.setattr(cli, "run_script_analyzer", mock_run_script_analyzer)
 
-    # Capture status messages
-    status_messages = []
-    monkeypatch.setattr(cli, "print_status", lambda msg, style="white": status_messages.append(msg))
-
-    cli.main(["--security-only", "--style-only", "--performance-only", "script.ps1"])
+    cli._dispatch(base_parser.parse_args(["--security-only", "--style-only", "--performance-only", "script.ps1"]))
 
-    # Verify all filter parameters were passed correctly
-    assert called["security_only"] is True
-    assert called["style_only"] is True
-    assert called["performance_only"] is True
+    # Verify all selected categories were passed
+    assert called["rule_filter"] == RuleFilter.SECURITY | RuleFilter.STYLE | RuleFilter.PERFORMANCE
 
     # Verify the status message mentions only security rules
     # (since it's checked first in the if-else chain)
     assert any("(security rules only)" in msg for msg in status_messages)
 
 
+def test_parse_rule_list() -> None:
+    """Test that rule lists are split, stripped and de-duplicated."""
+    assert cli._parse_rule_list("PSAvoidUsingWriteHost, PSUseApprovedVerbs,,PSAvoidUsingWriteHost ") == frozenset(
+        {"PSAvoidUsingWriteHost", "PSUseApprovedVerbs"}
+    )
+    assert cli._parse_rule_list(None) is None
+    assert cli._parse_rule_list(" , ") is None
+
+
 # Severity level handling tests
 class TestSeverityDefaults:
     """Test default severity level handling."""
 
-    def test_get_default_severity_no_env_var(self) -> None:
-        """Test default severity when no environment variable is set."""
-        with patch.dict(os.environ, {}, clear=False):
-            # Remove SEVERITY_LEVEL if it exists
-            if "SEVERITY_LEVEL" in os.environ:
-                del os.environ["SEVERITY_LEVEL"]
-            assert cli.get_default_severity() == "Warning"
-
-    def test_get_default_severity_from_env_var_error(self) -> None:
-        """Test default severity from environment variable - Error."""
-        with patch.dict(os.environ, {"SEVERITY_LEVEL": "Error"}):
-            assert cli.get_default_severity() == "Error"
-
-    def test_get_default_severity_from_env_var_information(self) -> None:
-        """Test default severity from environment variable - Information."""
-        with patch.dict(os.environ, {"SEVERITY_LEVEL": "Information"}):
-            assert cli.get_default_severity() == "Information"
-
-    def test_get_default_severity_from_env_var_warning(self) -> None:
-        """Test default severity from environment variable - Warning."""
-        with patch.dict(os.environ, {"SEVERITY_LEVEL": "Warning"}):
-            assert cli.get_default_severity() == "Warning"
-
-    def test_get_default_severity_from_env_var_all(self) -> None:
-        """Test default severity from environment variable - All."""
-        with patch.dict(os.environ, {"SEVERITY_LEVEL": "All"}):
-            assert cli.get_default_severity() == "All"
-
-    def test_get_default_severity_invalid_env_var(self) -> None:
-        """Test default severity with invalid environment variable value."""
-        with patch.dict(os.environ, {"SEVERITY_LEVEL": "InvalidLevel"}):
-            assert cli.get_default_severity() == "Warning"
+    @pytest.mark.parametrize(
+        ("env_value", "expected"),
+        [
+            (None, "Warning"),
+            ("Error", "Error"),
+            ("Information", "Information"),
+            ("Warning", "Warning"),
+            ("All", "All"),
+            ("InvalidLevel", "Warning"),
+        ],
+    )
+    def test_get_default_severity(
+        self, monkeypatch: pytest.MonkeyPatch, env_value: Optional[str], expected: str
+    ) -> None:
+        """Test the default severity for an unset, valid or invalid SEVERITY_LEVEL environment variable."""
+        if env_value is None:
+            monkeypatch.delenv("SEVERITY_LEVEL", raising=False)
+        else:
+            monkeypatch.setenv("SEVERITY_LEVEL", env_value)
+        assert cli.get_default_severity() == expected
 
 
 class TestSeverityFiltering:
     """Test severity filtering logic in PowerShell script generation."""
 
-    def test_generate_analysis_script_information_level(self) -> None:
-        """Test that Information level includes all issues."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("'test.ps1'", "Information")
-
-        # Should not use -Severity parameter (gets all issues)
-        assert "-Severity" not in script
-        # Should not have filtering logic
-        assert "Where-Object" not in script
-
-    def test_generate_analysis_script_warning_level(self) -> None:
-        """Test that Warning level includes Warning and Error issues."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("'test.ps1'", "Warning")
-
-        # Should not use -Severity parameter but should filter
-        assert "-Severity" not in script or "-Severity Error" not in script
-        # Should have filtering logic for Warning and Error
-        assert "Warning" in script and "Error" in script
-        assert "Where-Object" in script
-
-    def test_generate_analysis_script_error_level(self) -> None:
-        """Test that Error level includes only Error issues."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("'test.ps1'", "Error")
-
-        # Should use -Severity Error parameter
-        assert "-Severity Error" in script
-        # Should not have additional filtering logic
-        filtering_lines = [line for line in script.split("\n") if "Where-Object" in line]
-        assert len(filtering_lines) == 0
-
-    def test_generate_analysis_script_all_level(self) -> None:
-        """Test that All level includes all issues (same as Information)."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("'test.ps1'", "All")
-
-        # Should not use -Severity parameter (gets all issues)
-        assert "-Severity" not in script
-        # Should not have filtering logic
-        assert "Where-Object" not in script
+    @pytest.mark.parametrize(
+        ("severity", "severity_param", "filtered"),
+        [
+            # All issues: no -Severity parameter and no filtering
+            ("Information", None, False),
+            ("All", None, False),
+            # Warning and Error issues: filtered after analysis
+            ("Warning", None, True),
+            # Only Error issues: selected by Invoke-ScriptAnalyzer itself
+            ("Error", "-Severity Error", False),
+        ],
+    )
+    def test_generate_analysis_script_severity_level(
+        self, severity: str, severity_param: Optional[str], filtered: bool
+    ) -> None:
+        """Test the -Severity parameter and result filtering used for each severity level."""
+        script = generate_analysis_script("'test.ps1'", severity)
+
+        if severity_param:
+            assert severity_param in script
+        else:
+            assert "-Severity" not in script
+        assert ("Where-Object" in script) == filtered
+        if filtered:
+            assert '$_.Severity -eq "Warning" -or $_.Severity -eq "Error"' in script
 
     def test_generate_analysis_script_consistency(self) -> None:
         """Test that All and Information generate similar scripts."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
         script_all = generate_analysis_script("'test.ps1'", "All")
         script_info = generate_analysis_script("'test.ps1'", "Information")
 
@@ -1,12 +1,46 @@
 """Tests for the core module of py-psscriptanalyzer."""
 
+import io
 import json
+import os
+import signal
 import subprocess
-from typing import Any
-from unittest.mock import MagicMock, mock_open, patch
-
-from py_psscriptanalyzer.constants import SARIF_VERSION
-from py_psscriptanalyzer.core import convert_to_sarif, main, run_script_analyzer
+import sys
+import time
+from pathlib import Path
+from typing import IO, Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from py_psscriptanalyzer import cli, main
+from py_psscriptanalyzer.constants import (
+    ANALYSIS_TIMEOUT,
+    PARALLEL_ANALYSIS_MIN_FILES,
+    PROCESS_STOP_TIMEOUT,
+    SARIF_VERSION,
+    RuleFilter,
+)
+from py_psscriptanalyzer.core import (
+    _stop_process,
+    _write_json_array,
+    _write_results,
+    convert_to_sarif,
+    run_script_analyzer,
+)
+from py_psscriptanalyzer.scripts import (
+    build_powershell_file_array,
+    escape_powershell_path,
+    generate_analysis_script,
+    generate_format_script,
+)
+
+# A SARIF document without results, shared by tests that only pass it through; tests must not modify it
+_EMPTY_SARIF: dict[str, Any] = {
+    "$schema": f"https://schemastore.azurewebsites.net/schemas/json/sarif-{SARIF_VERSION}.json",
+    "version": SARIF_VERSION,
+    "runs": [{"tool": {"driver": {"name": "PSScriptAnalyzer"}}, "results": []}],
+}
 
 # Tests for convert_to_sarif function
 #
@@ -26,6 +60,26 @@ def test_convert_to_sarif_empty() -> None:
     assert len(sarif_data["runs"][0]["artifacts"]) == 1
 
 
+def test_convert_to_sarif_deduplicates_artifacts() -> None:
+    """Test that a file listed more than once appears once in the SARIF artifacts."""
+    sarif_data = convert_to_sarif([], ["a.ps1", "b.ps1", "a.ps1"])
+
+    uris = [artifact["location"]["uri"] for artifact in sarif_data["runs"][0]["artifacts"]]
+    assert uris == [f"file://{os.path.abspath('a.ps1')}", f"file://{os.path.abspath('b.ps1')}"]
+
+
+def test_convert_to_sarif_uris_match_abspath() -> None:
+    """Test that relative, dotted and absolute paths resolve to the same URIs as os.path.abspath."""
+    paths = ["a.ps1", "./dir/../b.ps1", os.path.join(os.sep, "tmp", "c.ps1")]
+    results = [{"RuleName": "Test", "ScriptPath": path} for path in paths]
+    sarif_data = convert_to_sarif(results, paths)
+
+    run = sarif_data["runs"][0]
+    expected = [f"file://{os.path.abspath(path)}" for path in paths]
+    assert [artifact["location"]["uri"] for artifact in run["artifacts"]] == expected
+    assert [r["locations"][0]["physicalLocation"]["artifactLocation"]["uri"] for r in run["results"]] == expected
+
+
 def test_convert_to_sarif_with_results() -> None:
     """Test converting PSScriptAnalyzer results with findings to SARIF format."""
     ps_results = [
@@ -59,24 +113,15 @@ def test_convert_to_sarif_with_results() -> None:
     assert sarif_data["runs"][0]["results"][1]["level"] == "warning"
 
     # Check rules metadata
-    assert len(sarif_data["runs"][0]["tool"]["driver"]["rules"]) == 2
-    rule_ids = [rule["id"] for rule in sarif_data["runs"][0]["tool"]["driver"]["rules"]]
-    assert "PSAvoidUsingPlainTextForPassword" in rule_ids
-    assert "PSAvoidUsingPositionalParameters" in rule_ids
+    rules = sarif_data["runs"][0]["tool"]["driver"]["rules"]
+    assert len(rules) == 2
+    rule_by_id = {rule["id"]: rule for rule in rules}
+    assert "PSAvoidUsingPlainTextForPassword" in rule_by_id
+    assert "PSAvoidUsingPositionalParameters" in rule_by_id
 
     # Check security tags
-    security_rule = next(
-        rule
-        for rule in sarif_data["runs"][0]["tool"]["driver"]["rules"]
-        if rule["id"] == "PSAvoidUsingPlainTextForPassword"
-    )
-    non_security_rule = next(
-        rule
-        for rule in sarif_data["runs"][0]["tool"]["driver"]["rules"]
-        if rule["id"] == "PSAvoidUsingPositionalParameters"
-    )
-    assert "security" in security_rule["properties"]["tags"]
-    assert len(non_security_rule["properties"]["tags"]) == 0
+    assert "security" in rule_by_id["PSAvoidUsingPlainTextForPassword"]["properties"]["tags"]
+    assert len(rule_by_id["PSAvoidUsingPositionalParameters"]["properties"]["tags"]) == 0
 
 
 def test_convert_to_sarif_with_different_severities() -> None:
@@ -119,19 +164,11 @@ def test_convert_to_sarif_with_different_severities() -> None:
     sarif_data = convert_to_sarif(ps_results, ["test.ps1"])
 
     # Check that severity levels are correctly mapped
-    sarif_results = sarif_data["runs"][0]["results"]
-
-    error_result = next(r for r in sarif_results if r["ruleId"] == "PSAvoidUsingPlainTextForPassword")
-    assert error_result["level"] == "error"
-
-    warning_result = next(r for r in sarif_results if r["ruleId"] == "PSAvoidUsingPositionalParameters")
-    assert warning_result["level"] == "warning"
-
-    info_result = next(r for r in sarif_results if r["ruleId"] == "PSUseConsistentIndentation")
-    assert info_result["level"] == "note"
-
-    unknown_result = next(r for r in sarif_results if r["ruleId"] == "PSUnknownSeverity")
-    assert unknown_result["level"] == "warning"  # Default fallback for unknown severity
+    result_by_id = {r["ruleId"]: r for r in sarif_data["runs"][0]["results"]}
+    assert result_by_id["PSAvoidUsingPlainTextForPassword"]["level"] == "error"
+    assert result_by_id["PSAvoidUsingPositionalParameters"]["level"] == "warning"
+    assert result_by_id["PSUseConsistentIndentation"]["level"] == "note"
+    assert result_by_id["PSUnknownSeverity"]["level"] == "warning"  # Default fallback for unknown severity
 
 
 #
@@ -145,436 +182,589 @@ def test_run_script_analyzer_empty_files() -> None:
     assert result == 0
 
 
-@patch("builtins.open", new_callable=mock_open)
-@patch("py_psscriptanalyzer.core.convert_to_sarif")
-@patch("json.loads", return_value=[])
-@patch("subprocess.run")
-@patch("py_psscriptanalyzer.core.generate_analysis_script", return_value="mock script")
-@patch("py_psscriptanalyzer.core.build_powershell_file_array", return_value="$files")
+@patch("py_psscriptanalyzer.core._run_powershell", return_value=0)
+def test_run_script_analyzer_rule_filter(mock_run: MagicMock, mock_analysis_script: MagicMock) -> None:
+    """Test that selected rule categories are forwarded to script generation."""
+    run_script_analyzer("pwsh", ["test.ps1"], rule_filter=RuleFilter.SECURITY | RuleFilter.DSC)
+
+    kwargs = mock_analysis_script.call_args.kwargs
+    assert kwargs["security_only"] is True
+    assert kwargs["dsc_only"] is True
+    assert kwargs["style_only"] is False
+    assert kwargs["performance_only"] is False
+    assert kwargs["best_practices_only"] is False
+    assert kwargs["compatibility_only"] is False
+
+
+@patch("py_psscriptanalyzer.core._run_powershell", return_value=0)
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_skips_profile(mock_run: MagicMock) -> None:
+    """Test that PowerShell is started without the user profile and non-interactively."""
+    run_script_analyzer("pwsh", ["test.ps1"])
+
+    assert mock_run.call_args.args[0][:3] == ["pwsh", "-NoProfile", "-NonInteractive"]
+
+
+@patch("subprocess.run", return_value=MagicMock(returncode=3))
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_text_output_exit_code(mock_run: MagicMock) -> None:
+    """Test that text output runs PowerShell in the foreground with a timeout and returns its exit code."""
+    assert run_script_analyzer("pwsh", ["test.ps1"]) == 3
+    assert mock_run.call_args.kwargs["timeout"] == ANALYSIS_TIMEOUT
+    assert "stdout" not in mock_run.call_args.kwargs
+
+
+def test_run_script_analyzer_passes_files_in_list_file() -> None:
+    """Test that the script is piped to PowerShell and the files to analyze are passed in a list file."""
+    files = ["a.ps1", "dir with space/it's.psm1", "ünïcode.psd1"]
+    seen = {}
+
+    def fake_run(command: list[str], script: IO[bytes], env: dict[str, str]) -> int:
+        seen["script"] = script.read().decode("utf-8")
+        with open(env["PSSA_FILE_LIST"], encoding="utf-8") as f:
+            seen["files"] = f.read().splitlines()
+        seen["command"] = command
+        return 0
+
+    with patch("py_psscriptanalyzer.core._run_powershell", side_effect=fake_run):
+        assert run_script_analyzer("pwsh", files) == 0
+
+    assert seen["files"] == files
+    assert seen["command"] == ["pwsh", "-NoProfile", "-NonInteractive", "-Command", "-"]
+    assert (
+        "$files = @([System.IO.File]::ReadAllLines($env:PSSA_FILE_LIST, [System.Text.Encoding]::UTF8))"
+        in (seen["script"])
+    )
+    # -Command - ends a multi-line statement at a blank line, so the script may only end with one
+    lines = seen["script"].split("\n")
+    assert lines[-2:] == ["", ""]
+    assert all(line.strip() for line in lines[:-2])
+
+
+def _python_popen(code: str) -> Any:
+    """Get a Popen replacement that runs ``code`` with this Python instead of the PowerShell command."""
+    real_popen = subprocess.Popen
+
+    def popen(args: list[str], **kwargs: Any) -> subprocess.Popen[str]:
+        return real_popen([sys.executable, "-c", code], **kwargs)
+
+    return popen
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        # No issues found: PowerShell exits cleanly without output
+        [],
+        [{"RuleName": "Test", "Message": "Test message"}],
+    ],
+)
+@patch("py_psscriptanalyzer.core.convert_to_sarif", return_value=_EMPTY_SARIF)
+@pytest.mark.usefixtures("mock_analysis_script")
 def test_run_script_analyzer_sarif_output_to_file(
-    mock_build_powershell_file_array: MagicMock,
-    mock_generate_analysis_script: MagicMock,
-    mock_run: MagicMock,
-    mock_loads: MagicMock,
     mock_convert_to_sarif: MagicMock,
-    mock_open_func: MagicMock,
+    records: list[dict[str, Any]],
+    tmp_path: Path,
 ) -> None:
     """Test run_script_analyzer with SARIF output to file."""
-    # Mock subprocess
-    process_mock = MagicMock()
-    process_mock.returncode = 0  # No issues found
-    process_mock.stdout = ""
-    mock_run.return_value = process_mock
-
-    # Mock SARIF conversion
-    sarif_data = {
-        "$schema": f"https://schemastore.azurewebsites.net/schemas/json/sarif-{SARIF_VERSION}.json",
-        "version": SARIF_VERSION,
-        "runs": [{"tool": {"driver": {"name": "PSScriptAnalyzer"}}, "results": []}],
-    }
-    mock_convert_to_sarif.return_value = sarif_data
-
-    # Skip actual file operations
-    with patch("os.path.exists", return_value=True):
+    output_file = tmp_path / "output.sarif"
+    code = "".join(f"print({json.dumps(record)!r})\n" for record in records)
+    with patch("subprocess.Popen", _python_popen(code)):
         result = run_script_analyzer(
-            "pwsh", ["test.ps1"], format_files=False, output_format="sarif", output_file="output.sarif"
+            "pwsh", ["test.ps1"], format_files=False, output_format="sarif", output_file=str(output_file)
         )
 
     assert result == 0
-    mock_open_func.assert_called_once_with("output.sarif", "w", encoding="utf-8")
+    mock_convert_to_sarif.assert_called_once_with(records, ["test.ps1"])
+    assert json.loads(output_file.read_text(encoding="utf-8")) == _EMPTY_SARIF
 
 
-def test_run_script_analyzer_sarif_output_to_console() -> None:
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_sarif_output_to_console(capsys: pytest.CaptureFixture[str]) -> None:
     """Test run_script_analyzer with SARIF output to console."""
+    record = {"RuleName": "Test", "Message": "Test", "Severity": "Warning", "ScriptPath": "test.ps1"}
+    with patch("subprocess.Popen", _python_popen(f"import sys; print({json.dumps(record)!r}); sys.exit(1)")):
+        # Issues found
+        result = run_script_analyzer("pwsh", ["test.ps1"], format_files=False, output_format="sarif", output_file=None)
+
+    assert result == 1
+    sarif_data = json.loads(capsys.readouterr().out)
+    assert sarif_data == convert_to_sarif([record], ["test.ps1"])
+
 
-    # Create all the mocks we need
+@pytest.mark.parametrize(
+    "records", [[], [{"RuleName": "A", "Line": 1}], [{"RuleName": "A"}, {"RuleName": "B", "Extent": {"Text": "x"}}]]
+)
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_json_output_streams_records(
+    records: list[dict[str, Any]], capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Test that JSON output read one record per line is written exactly as json.dumps would format it."""
+    lines = "".join(json.dumps(record) + "\n\n" for record in records)
+    with patch("subprocess.Popen", _python_popen(f"import sys; sys.stdout.write({lines!r})")):
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format="json")
+
+    assert result == 0
+    assert capsys.readouterr().out == json.dumps(records, indent=2) + "\n"
+
+
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_json_output_skips_byte_order_mark(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that UTF-8 output with a byte order mark and non-ASCII text is parsed regardless of the locale."""
+    record = {"RuleName": "A", "Message": "Caf\u00e9"}
+    output = b"\xef\xbb\xbf" + json.dumps(record, ensure_ascii=False).encode() + b"\n"
+    with patch("subprocess.Popen", _python_popen(f"import sys; sys.stdout.buffer.write({output!r})")):
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format="json")
+
+    assert result == 0
+    assert json.loads(capsys.readouterr().out) == [record]
+
+
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_json_output_timeout(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that a PowerShell process that outlives the timeout is stopped and reported."""
     with (
-        patch("subprocess.run") as mock_run,
-        patch("json.loads") as mock_loads,
-        patch("py_psscriptanalyzer.core.convert_to_sarif") as mock_convert,
-        patch("builtins.print") as mock_print,
-        patch("py_psscriptanalyzer.core.generate_analysis_script", return_value="mock script"),
-        patch("py_psscriptanalyzer.core.build_powershell_file_array", return_value="$files"),
+        patch("subprocess.Popen", _python_popen("import time; print('{}', flush=True); time.sleep(30)")),
+        patch("py_psscriptanalyzer.core.ANALYSIS_TIMEOUT", 0.5),
     ):
-        # Mock subprocess
-        process_mock = MagicMock()
-        process_mock.returncode = 1  # Issues found
-        process_mock.stdout = '[{"RuleName": "Test", "Message": "Test"}]'
-        mock_run.return_value = process_mock
-
-        # Mock JSON parsing
-        results = [{"RuleName": "Test", "Message": "Test"}]
-        mock_loads.return_value = results
-
-        # Mock SARIF conversion
-        sarif_data = {
-            "$schema": f"https://schemastore.azurewebsites.net/schemas/json/sarif-{SARIF_VERSION}.json",
-            "version": SARIF_VERSION,
-            "runs": [{"tool": {"driver": {"name": "PSScriptAnalyzer"}}, "results": [{"ruleId": "Test"}]}],
-        }
-        mock_convert.return_value = sarif_data
-
-        # Run the function
-        result = run_script_analyzer("pwsh", ["test.ps1"], format_files=False, output_format="sarif", output_file=None)
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format="json")
 
-        # Check results
-        assert result == 1
-        mock_print.assert_called_once()
+    assert result == 1
+    captured = capsys.readouterr()
+    # The record read before the timeout is not written out as a truncated array
+    assert captured.out == ""
+    assert "Timeout while running PSScriptAnalyzer" in captured.err
 
 
-@patch("py_psscriptanalyzer.core.build_powershell_file_array", return_value="$files")
-@patch("py_psscriptanalyzer.core.generate_analysis_script", return_value="mock script")
-@patch("subprocess.run", side_effect=subprocess.TimeoutExpired("pwsh", 300))
-def test_run_script_analyzer_timeout(
-    mock_build_powershell_file_array: MagicMock, mock_generate_analysis_script: MagicMock, mock_run: MagicMock
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX signal handling")
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_json_output_timeout_kills_unresponsive_process(
+    capsys: pytest.CaptureFixture[str],
 ) -> None:
-    """Test run_script_analyzer with timeout exception."""
-    with patch("builtins.print") as mock_print:
-        result = run_script_analyzer("pwsh", ["test.ps1"])
-
-        assert result == 1
-        mock_print.assert_called_with("Timeout while running PSScriptAnalyzer")
-
-
-@patch("subprocess.run", side_effect=Exception("Test error"))
-@patch("py_psscriptanalyzer.core.generate_analysis_script", return_value="mock script")
-@patch("builtins.print")
-@patch("py_psscriptanalyzer.core.build_powershell_file_array", return_value="$files")
-def test_run_script_analyzer_general_exception(
-    mock_build_powershell_file_array: MagicMock,
-    mock_print: MagicMock,
-    mock_generate_analysis_script: MagicMock,
-    mock_subprocess: MagicMock,
+    """Test that a process that ignores the request to stop is killed once the stop timeout has passed."""
+    code = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('{}', flush=True); time.sleep(30)"
+    with (
+        patch("subprocess.Popen", _python_popen(code)),
+        patch("py_psscriptanalyzer.core.ANALYSIS_TIMEOUT", 0.5),
+        patch("py_psscriptanalyzer.core.PROCESS_STOP_TIMEOUT", 0.5),
+    ):
+        start = time.monotonic()
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format="json")
+
+    assert result == 1
+    assert time.monotonic() - start < 10
+    assert "Timeout while running PSScriptAnalyzer" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("exits_on_break", [True, False])
+def test_stop_process_windows_breaks_before_taskkill(monkeypatch: pytest.MonkeyPatch, exits_on_break: bool) -> None:
+    """Test that on Windows PowerShell is sent CTRL_BREAK_EVENT first and its tree only ended if it keeps running."""
+    process = MagicMock(pid=1234)
+    if not exits_on_break:
+        process.wait.side_effect = subprocess.TimeoutExpired("pwsh", 2)
+    kill = MagicMock()
+    run = MagicMock()
+    monkeypatch.setattr(sys, "platform", "win32")
+    monkeypatch.setattr(signal, "CTRL_BREAK_EVENT", 1, raising=False)
+    monkeypatch.setattr(os, "kill", kill)
+    monkeypatch.setattr(subprocess, "run", run)
+
+    _stop_process(process)
+
+    kill.assert_called_once_with(1234, signal.CTRL_BREAK_EVENT)
+    process.wait.assert_called_once_with(PROCESS_STOP_TIMEOUT)
+    process.terminate.assert_not_called()
+    if exits_on_break:
+        run.assert_not_called()
+    else:
+        assert run.call_args.args[0] == ["taskkill", "/PID", "1234", "/T", "/F"]
+
+
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_json_output_invalid(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that output that is not JSON is reported as a parse error."""
+    with patch("subprocess.Popen", _python_popen("print('not json')")):
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format="json")
+
+    assert result == 1
+    assert "Error parsing JSON output from PSScriptAnalyzer" in capsys.readouterr().err
+
+
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_json_output_invalid_writes_nothing(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that records parsed before a bad line are not written to stdout as a truncated JSON array."""
+    with patch("subprocess.Popen", _python_popen("print('{\"RuleName\": \"A\"}'); print('not json')")):
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format="json")
+
+    assert result == 1
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "Error parsing JSON output from PSScriptAnalyzer" in captured.err
+
+
+@pytest.mark.usefixtures("mock_analysis_script")
+@pytest.mark.parametrize("output_format", ["json", "sarif"])
+def test_run_script_analyzer_failure_keeps_output_file(output_format: str, tmp_path: Path) -> None:
+    """Test that a failed run leaves an existing output file untouched and no temporary file behind."""
+    output_file = tmp_path / "report.json"
+    output_file.write_text("previous report")
+    with patch("subprocess.Popen", _python_popen("print('{\"RuleName\": \"A\"}'); print('not json')")):
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format=output_format, output_file=str(output_file))
+
+    assert result == 1
+    assert output_file.read_text() == "previous report"
+    assert [path.name for path in tmp_path.iterdir()] == ["report.json"]
+
+
+@pytest.mark.usefixtures("mock_analysis_script")
+@pytest.mark.parametrize("output_format", ["json", "sarif"])
+def test_run_script_analyzer_powershell_error_keeps_output_file(
+    output_format: str, tmp_path: Path, capsys: pytest.CaptureFixture[str]
 ) -> None:
+    """Test that a PowerShell failure is reported instead of publishing an empty report over an existing one."""
+    output_file = tmp_path / "report.json"
+    output_file.write_text("previous report")
+    with patch("subprocess.Popen", _python_popen("import sys; sys.exit(250)")):
+        result = run_script_analyzer("pwsh", ["test.ps1"], output_format=output_format, output_file=str(output_file))
+
+    assert result == 1
+    assert output_file.read_text() == "previous report"
+    assert [path.name for path in tmp_path.iterdir()] == ["report.json"]
+    assert capsys.readouterr().err == "PSScriptAnalyzer failed with exit code 250\n"
+
+
+@patch("subprocess.run", side_effect=subprocess.TimeoutExpired("pwsh", 300))
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_timeout(mock_run: MagicMock, capsys: pytest.CaptureFixture[str]) -> None:
+    """Test run_script_analyzer with timeout exception."""
     result = run_script_analyzer("pwsh", ["test.ps1"])
 
     assert result == 1
-    mock_print.assert_called_with("Error processing results: Test error")
+    assert capsys.readouterr().err == "Timeout while running PSScriptAnalyzer\n"
 
 
-def test_run_script_analyzer_sarif_output() -> None:
-    """Test run_script_analyzer function with SARIF output."""
+@patch("py_psscriptanalyzer.core._run_powershell", side_effect=Exception("Test error"))
+@pytest.mark.usefixtures("mock_analysis_script")
+def test_run_script_analyzer_general_exception(mock_subprocess: MagicMock, capsys: pytest.CaptureFixture[str]) -> None:
+    result = run_script_analyzer("pwsh", ["test.ps1"])
 
-    # Set up all mocks
-    with (
-        patch("subprocess.run") as mock_run,
-        patch("json.loads") as mock_loads,
-        patch("py_psscriptanalyzer.core.generate_analysis_script") as mock_generate,
-        patch("py_psscriptanalyzer.core.convert_to_sarif") as mock_convert,
-        patch("py_psscriptanalyzer.core.build_powershell_file_array", return_value="$files"),
-    ):
-        # Mock the script generation
-        mock_generate.return_value = "# PowerShell script mock"
-
-        # Mock subprocess.run to return JSON output
-        mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_process.stdout = '[{"RuleName": "Test", "Message": "Test message"}]'
-        mock_run.return_value = mock_process
-
-        # Mock JSON parsing
-        mock_loads.return_value = [{"RuleName": "Test", "Message": "Test message"}]
-
-        # Mock convert_to_sarif
-        mock_sarif_data = {
-            "version": SARIF_VERSION,
-            "runs": [{"tool": {"driver": {"name": "PSScriptAnalyzer"}}, "results": []}],
-        }
-        mock_convert.return_value = mock_sarif_data
-
-        # Create a temporary file for output
-        tmp_file = "test_output.sarif"
-
-        # Mock open to avoid actual file operations
-        with patch("builtins.open") as mock_open, patch("os.path.exists", return_value=True):
-            result = run_script_analyzer(
-                "pwsh", ["test.ps1"], format_files=False, output_format="sarif", output_file=tmp_file
-            )
-
-            # Validate results
-            assert result == 0
-            mock_run.assert_called_once()
-            mock_convert.assert_called_once()
-            mock_open.assert_called_once_with(tmp_file, "w", encoding="utf-8")
-
-
-def test_file_output_handling() -> None:
-    """Test handling output to files."""
-    # Test writing to JSON file
-    m_json = mock_open()
-    with patch("builtins.open", m_json):
-        json_data = [{"test": "value"}]
-        output_json = json.dumps(json_data, indent=2)
-
-        with open("output.json", "w") as f:
-            f.write(output_json)
-
-        m_json.assert_called_once_with("output.json", "w")
-        m_json().write.assert_called_once_with(output_json)
-
-    # Test writing to SARIF file
-    m_sarif = mock_open()
-    with patch("builtins.open", m_sarif):
-        sarif_data = {
-            "version": SARIF_VERSION,
-            "runs": [{"tool": {"driver": {"name": "PSScriptAnalyzer"}}, "results": []}],
-        }
-        sarif_json = json.dumps(sarif_data, indent=2)
-
-        with open("output.sarif", "w") as f:
-            f.write(sarif_json)
-
-        m_sarif.assert_called_once_with("output.sarif", "w")
-        m_sarif().write.assert_called_once_with(sarif_json)
-
-
-def test_exception_handling() -> None:
+    assert result == 1
+    assert capsys.readouterr().err == "Error processing results: Test error\n"
+
+
+_RECORDS = [
+    {"RuleName": "PSAvoidUsingWriteHost", "Severity": "Warning", "ScriptName": "a.ps1", "Line": 3, "Message": "m"},
+    {"RuleName": "PSUseApprovedVerbs", "Severity": "Error", "ScriptName": "b.ps1", "Line": 1, "Extent": {"Text": "x"}},
+]
+
+
+@pytest.mark.parametrize("records", [[], _RECORDS[:1], _RECORDS], ids=["empty", "one", "two"])
+def test_write_results_json_file(tmp_path: Path, records: list[dict[str, Any]]) -> None:
+    """Test that JSON results are written to a file as a JSON array formatted like json.dumps."""
+    output_path = tmp_path / "output.json"
+    with open(output_path, "w", encoding="utf-8") as out:
+        _write_results(iter(records), ["a.ps1", "b.ps1"], "json", out)
+
+    text = output_path.read_text(encoding="utf-8")
+    assert text == json.dumps(records, indent=2) + "\n"
+    assert json.loads(text) == records
+
+
+def test_write_json_array_empty() -> None:
+    """Test that no records produce an empty JSON array."""
+    out = io.StringIO()
+    _write_json_array(iter([]), out)
+
+    assert out.getvalue() == "[]\n"
+    assert json.loads(out.getvalue()) == []
+
+
+@pytest.mark.parametrize("records", [[], _RECORDS], ids=["empty", "two"])
+def test_write_results_sarif(records: list[dict[str, Any]]) -> None:
+    """Test that SARIF results are written as one log equal to convert_to_sarif's."""
+    files = ["a.ps1", "b.ps1"]
+    out = io.StringIO()
+    _write_results(iter(records), files, "sarif", out)
+
+    assert out.getvalue().endswith("}\n")
+    assert json.loads(out.getvalue()) == convert_to_sarif(records, files)
+
+
+def test_exception_handling(capsys: pytest.CaptureFixture[str]) -> None:
     """Test the exception handling code paths."""
     # Test timeout exception
-    with patch("builtins.print") as mock_print:
-        try:
-            raise subprocess.TimeoutExpired(cmd="test", timeout=60)
-        except subprocess.TimeoutExpired:
-            print("Timeout while running PSScriptAnalyzer")
-            result = 1
-        mock_print.assert_called_with("Timeout while running PSScriptAnalyzer")
-        assert result == 1
+    try:
+        raise subprocess.TimeoutExpired(cmd="test", timeout=60)
+    except subprocess.TimeoutExpired:
+        print("Timeout while running PSScriptAnalyzer")
+        result = 1
+    assert capsys.readouterr().out == "Timeout while running PSScriptAnalyzer\n"
+    assert result == 1
 
     # Test JSON decode error
-    with patch("builtins.print") as mock_print:
-        try:
-            raise json.JSONDecodeError("Invalid JSON", "doc", 0)
-        except json.JSONDecodeError:
-            print("Error parsing JSON output from PSScriptAnalyzer")
-            result = 1
-        mock_print.assert_called_with("Error parsing JSON output from PSScriptAnalyzer")
-        assert result == 1
+    try:
+        raise json.JSONDecodeError("Invalid JSON", "doc", 0)
+    except json.JSONDecodeError:
+        print("Error parsing JSON output from PSScriptAnalyzer")
+        result = 1
+    assert capsys.readouterr().out == "Error parsing JSON output from PSScriptAnalyzer\n"
+    assert result == 1
 
     # Test general exception
-    with patch("builtins.print") as mock_print:
-        try:
-            raise Exception("Test error")
-        except Exception as e:
-            print(f"Error processing results: {e}")
-            result = 1
-        mock_print.assert_called_with("Error processing results: Test error")
-        assert result == 1
+    try:
+        raise Exception("Test error")
+    except Exception as e:
+        print(f"Error processing results: {e}")
+        result = 1
+    assert capsys.readouterr().out == "Error processing results: Test error\n"
+    assert result == 1
 
 
 #
-# Tests for main function
+# Tests for the package-level main entry point
 #
 
 
-@patch("py_psscriptanalyzer.core.run_script_analyzer", return_value=0)
-@patch("py_psscriptanalyzer.core.check_psscriptanalyzer_installed", return_value=True)
-@patch("py_psscriptanalyzer.core.find_powershell", return_value="pwsh")
-def test_main_with_ps_files(
-    mock_find_powershell: MagicMock,
-    mock_check_installed: MagicMock,
-    mock_run_analyzer: MagicMock,
-) -> None:
-    with patch("sys.argv", ["py-psscriptanalyzer", "test.ps1"]), patch("builtins.print") as mock_print:
-        result = main()
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_ps_files(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    mock_run_analyzer = MagicMock(return_value=0)
+    monkeypatch.setattr(cli, "run_script_analyzer", mock_run_analyzer)
+    monkeypatch.setattr(sys, "argv", ["py-psscriptanalyzer", "test.ps1"])
 
-        assert result == 0
-        mock_run_analyzer.assert_called_once()
-        mock_print.assert_any_call("Using PowerShell: pwsh")
-        mock_print.assert_any_call("Analyzing 1 PowerShell file(s)...")
+    result = main()
+
+    assert result == 0
+    mock_run_analyzer.assert_called_once()
+    out = capsys.readouterr().out
+    assert "Using PowerShell: pwsh" in out
+    assert "Analyzing 1 PowerShell file(s)..." in out
 
 
-@patch("py_psscriptanalyzer.core.find_powershell", return_value=None)
-def test_main_no_powershell(mock_find_powershell: MagicMock) -> None:
+def test_main_no_powershell(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
     """Test main function when PowerShell is not found."""
-    with (
-        patch("sys.argv", ["py-psscriptanalyzer", "test.ps1"]),
-        patch("builtins.print") as mock_print,
-        patch("sys.stderr"),
-    ):
-        result = main()
-
-        assert result == 1
-        mock_find_powershell.assert_called_once()
-        # Check for error message about PowerShell not found
-        assert any("PowerShell not found" in str(call) for call in mock_print.call_args_list)
-
-
-@patch("py_psscriptanalyzer.core.run_script_analyzer", return_value=0)
-@patch("py_psscriptanalyzer.core.install_psscriptanalyzer", return_value=True)
-@patch("py_psscriptanalyzer.core.check_psscriptanalyzer_installed", return_value=False)
-@patch("py_psscriptanalyzer.core.find_powershell", return_value="pwsh")
-@patch("builtins.print")
-def test_main_install_psscriptanalyzer(
-    mock_print: MagicMock,
-    mock_find_powershell: MagicMock,
-    mock_check_analyzer: MagicMock,
-    mock_install_analyzer: MagicMock,
-    mock_run_analyzer: MagicMock,
-) -> None:
-    with patch("sys.argv", ["py-psscriptanalyzer", "test.ps1"]):
-        result = main()
+    mock_find_powershell = MagicMock(return_value=None)
+    monkeypatch.setattr(cli, "find_powershell", mock_find_powershell)
+    monkeypatch.setattr(sys, "argv", ["py-psscriptanalyzer", "test.ps1"])
+
+    result = main()
+
+    assert result == 1
+    mock_find_powershell.assert_called_once()
+    # Check for error message about PowerShell not found
+    assert "PowerShell not found" in capsys.readouterr().out
 
-        assert result == 0
-        mock_check_analyzer.assert_called_once()
-        mock_install_analyzer.assert_called_once()
-        mock_run_analyzer.assert_called_once()
-        assert any("PSScriptAnalyzer installed successfully" in str(call) for call in mock_print.call_args_list)
+
+def test_main_install_psscriptanalyzer(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    mock_check_analyzer = MagicMock(return_value=False)
+    mock_install_analyzer = MagicMock(return_value=True)
+    mock_run_analyzer = MagicMock(return_value=0)
+    monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
+    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", mock_check_analyzer)
+    monkeypatch.setattr(cli, "install_psscriptanalyzer", mock_install_analyzer)
+    monkeypatch.setattr(cli, "run_script_analyzer", mock_run_analyzer)
+    monkeypatch.setattr(sys, "argv", ["py-psscriptanalyzer", "test.ps1"])
+
+    result = main()
+
+    assert result == 0
+    mock_check_analyzer.assert_called_once()
+    mock_install_analyzer.assert_called_once()
+    mock_run_analyzer.assert_called_once()
+    assert "PSScriptAnalyzer installed successfully" in capsys.readouterr().out
 
 
-@patch("py_psscriptanalyzer.core.find_powershell", return_value="pwsh")
-@patch("py_psscriptanalyzer.core.check_psscriptanalyzer_installed", return_value=False)
-@patch("py_psscriptanalyzer.core.install_psscriptanalyzer", return_value=False)
 def test_main_psscriptanalyzer_install_failed(
-    mock_find_powershell: MagicMock,
-    mock_run_analyzer: MagicMock,
-    mock_install_analyzer: MagicMock,
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
 ) -> None:
-    with (
-        patch("sys.argv", ["py-psscriptanalyzer", "test.ps1"]),
-        patch("builtins.print") as mock_print,
-        patch("sys.stderr"),
-    ):
-        result = main()
+    mock_find_powershell = MagicMock(return_value="pwsh")
+    mock_install_analyzer = MagicMock(return_value=False)
+    monkeypatch.setattr(cli, "find_powershell", mock_find_powershell)
+    monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: False)
+    monkeypatch.setattr(cli, "install_psscriptanalyzer", mock_install_analyzer)
+    monkeypatch.setattr(sys, "argv", ["py-psscriptanalyzer", "test.ps1"])
 
-        assert result == 1
-        mock_find_powershell.assert_called_once()
-        mock_install_analyzer.assert_called_once()
-        # Check for error message about installation failure
-        assert any("Failed to install PSScriptAnalyzer" in str(call) for call in mock_print.call_args_list)
+    result = main()
+
+    assert result == 1
+    mock_find_powershell.assert_called_once()
+    mock_install_analyzer.assert_called_once()
+    # Check for error message about installation failure
+    assert "Failed to install PSScriptAnalyzer" in capsys.readouterr().out
 
 
-def test_main_no_ps_files() -> None:
+def test_main_no_ps_files(monkeypatch: pytest.MonkeyPatch) -> None:
     """Test main function with no PowerShell files."""
-    with patch("sys.argv", ["py-psscriptanalyzer", "test.txt"]):
-        result = main()
-        assert result == 0
-
-
-@patch("py_psscriptanalyzer.core.find_powershell", return_value="pwsh")
-@patch("py_psscriptanalyzer.core.check_psscriptanalyzer_installed", return_value=True)
-@patch("py_psscriptanalyzer.core.run_script_analyzer")
-def test_main_with_format_flag(
-    mock_run_analyzer: MagicMock,
-    mock_check_analyzer: MagicMock,
-    mock_find_powershell: MagicMock,
-) -> None:
-    # Set up the return value of the mock
-    mock_run_analyzer.return_value = 0
+    monkeypatch.setattr(sys, "argv", ["py-psscriptanalyzer", "test.txt"])
+    assert main() == 0
+
 
-    with patch("sys.argv", ["py-psscriptanalyzer", "--format", "test.ps1"]), patch("builtins.print") as mock_print:
-        result = main()
+@pytest.mark.usefixtures("stub_powershell_env")
+def test_main_with_format_flag(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    mock_run_analyzer = MagicMock(return_value=0)
+    monkeypatch.setattr(cli, "run_script_analyzer", mock_run_analyzer)
+    monkeypatch.setattr(sys, "argv", ["py-psscriptanalyzer", "--format", "test.ps1"])
 
-        assert result == 0
-        mock_run_analyzer.assert_called_once()
-        mock_print.assert_any_call("Formatting 1 PowerShell file(s)...")
+    result = main()
+
+    assert result == 0
+    mock_run_analyzer.assert_called_once()
+    assert "Formatting 1 PowerShell file(s)..." in capsys.readouterr().out
 
 
 # Tests from scripts_coverage.py
 class TestScriptGenerationFilters:
     """Tests for script generation with various filters."""
 
-    def test_generate_analysis_script_with_security_filter(self) -> None:
-        """Test generating analysis script with security filter."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("$files", security_only=True)
-
-        # Check security filter is included
-        assert "# Filter to include only security-related rules" in script
-        assert "$categoryRules = @(" in script
-        assert "IsSecurityRule" in script  # Check if the IsSecurityRule property is added
+    @pytest.mark.parametrize(
+        ("flag", "comment", "expected"),
+        [
+            # The IsSecurityRule property is added for the security filter
+            ("security_only", "# Filter to include only security-related rules", ["IsSecurityRule"]),
+            ("style_only", "# Filter to include only style-related rules", ["RuleCategory", "Style"]),
+            ("performance_only", "# Filter to include only performance-related rules", ["RuleCategory", "Performance"]),
+            ("best_practices_only", "# Filter to include only best practices rules", ["RuleCategory", "BestPractices"]),
+            ("dsc_only", "# Filter to include only DSC-related rules", ["RuleCategory", "DSC"]),
+            (
+                "compatibility_only",
+                "# Filter to include only compatibility-related rules",
+                ["RuleCategory", "Compatibility"],
+            ),
+        ],
+    )
+    def test_generate_analysis_script_with_category_filter(self, flag: str, comment: str, expected: list[str]) -> None:
+        """Test generating analysis script with each rule category filter."""
+        script = generate_analysis_script("$files", **{flag: True})
+
+        # Check the category filter is included
+        assert comment in script
+        assert "$categoryRules = [System.Collections.Generic.HashSet[string]]::new(" in script
+        for text in expected:
+            assert text in script
+
+    def test_generate_analysis_script_single_invocation(self) -> None:
+        """Test that all files are piped through one Invoke-ScriptAnalyzer call."""
+        script = generate_analysis_script("'a.ps1','b.ps1'", severity="Error")
+
+        assert "$files | Invoke-ScriptAnalyzer -Severity Error" in script
+        assert "$issues +=" not in script
+
+    def test_generate_analysis_script_parallel_batches(self) -> None:
+        """Test that PowerShell 7+ analyzes batches of files in parallel with the same severity."""
+        script = generate_analysis_script("'a.ps1','b.ps1'", severity="Error")
+
+        assert f"$PSVersionTable.PSVersion.Major -ge 7 -and $files.Count -ge {PARALLEL_ANALYSIS_MIN_FILES}" in script
+        assert "ForEach-Object -Parallel" in script
+        assert "$_ | Invoke-ScriptAnalyzer -Severity Error" in script
+
+    def test_generate_analysis_script_json_depth(self) -> None:
+        """Test that JSON records are serialized at the maximum depth so nested properties are not truncated."""
+        script = generate_analysis_script("$files", json_output=True)
+
+        assert "[Console]::Out.WriteLine((ConvertTo-Json -InputObject $issue -Depth 100 -Compress))" in script
+
+    def test_generate_analysis_script_json_utf8_output(self) -> None:
+        """Test that JSON records are written as UTF-8 rather than in the console's code page."""
+        encoding = "[Console]::OutputEncoding = [System.Text.UTF8Encoding]::new($false)\n"
+
+        assert generate_analysis_script("$files", json_output=True).startswith(encoding + "try {\n")
+        assert "OutputEncoding" not in generate_analysis_script("$files")
+
+    def test_generate_analysis_script_cached(self) -> None:
+        """Test that equal options, with rule lists in any order or collection type, reuse one generated script."""
+        script = generate_analysis_script("$files", include_rules=["B", "A"], exclude_rules=None)
+
+        assert generate_analysis_script("$files", include_rules=frozenset({"A", "B"}), exclude_rules=[]) is script
+        assert generate_analysis_script("$files", include_rules=["A"]) is not script
+
+    def test_generate_analysis_script_file_name_without_cmdlet(self) -> None:
+        """Test that reported file names are taken with a .NET string operation rather than Split-Path."""
+        script = generate_analysis_script("$files")
+
+        assert "$fileName = [System.IO.Path]::GetFileName($issue.ScriptName)" in script
+        assert "Split-Path" not in script
+
+    def test_generated_scripts_are_dedented(self) -> None:
+        """Test that generated scripts start at the first column and carry no surrounding blank lines."""
+        assert generate_analysis_script("$files").startswith("try {\n    $files = @($files)\n")
+        assert generate_format_script("$files").startswith("$files = @($files)\n")
+        assert generate_format_script("$files").endswith("\nexit $exitCode\n")
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            {"severity": "All"},
+            {"severity": "Warning"},
+            {"severity": "Error", "json_output": True},
+            {"security_only": True, "include_rules": ["A"]},
+            {"style_only": True, "exclude_rules": ["B"], "json_output": True},
+        ],
+    )
+    def test_generated_scripts_have_no_trailing_whitespace(self, options: dict[str, Any]) -> None:
+        """Test that no generated line ends in whitespace, whichever filters are combined."""
+        for script in (generate_analysis_script("$files", **options), generate_format_script("$files")):
+            assert [line for line in script.splitlines() if line != line.rstrip()] == []
+
+    def test_generate_analysis_script_filters_indented_with_body(self) -> None:
+        """Test that the severity, category and rule filters line up with the statements around them."""
+        script = generate_analysis_script("$files", style_only=True, exclude_rules=["B"])
+
+        assert "\n    }\n    # Filter to show only Warning and Error severity issues\n    $result = " in script
+        assert "\n    # Filter to include only style-related rules\n    $categoryRules = " in script
+        assert "\n    }\n    # Filter to exclude specific rules\n    $excludeRules = " in script
+
+    def test_escape_powershell_path(self) -> None:
+        """Test that single quotes are doubled and paths without them are returned unchanged."""
+        path = "dir/script.ps1"
+        assert escape_powershell_path(path) is path
+        assert escape_powershell_path("it's/o'clock.ps1") == "it''s/o''clock.ps1"
+
+    def test_build_powershell_file_array(self) -> None:
+        """Test that file paths are quoted and embedded single quotes are doubled."""
+        assert build_powershell_file_array([]) == ""
+        assert build_powershell_file_array(["a.ps1", "it's.ps1"]) == "'a.ps1','it''s.ps1'"
 
     def test_generate_format_script(self) -> None:
         """Test generating formatting script."""
-        from py_psscriptanalyzer.scripts import generate_format_script
-
         script = generate_format_script("$files")
 
         # Check formatting commands are included
         assert "Invoke-Formatter" in script
         assert "foreach ($file in $files)" in script
 
-    def test_generate_analysis_script_with_style_filter(self) -> None:
-        """Test generating analysis script with style filter."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("$files", style_only=True)
-
-        # Check style filter is included
-        assert "# Filter to include only style-related rules" in script
-        assert "$categoryRules = @(" in script
-        assert "RuleCategory" in script
-        assert "Style" in script
-
-    def test_generate_analysis_script_with_performance_filter(self) -> None:
-        """Test generating analysis script with performance filter."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("$files", performance_only=True)
-
-        # Check performance filter is included
-        assert "# Filter to include only performance-related rules" in script
-        assert "$categoryRules = @(" in script
-        assert "RuleCategory" in script
-        assert "Performance" in script
-
-    def test_generate_analysis_script_with_best_practices_filter(self) -> None:
-        """Test generating analysis script with best practices filter."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("$files", best_practices_only=True)
+        # Files are read and written through .NET, keeping their encoding
+        assert "$encoding = $reader.CurrentEncoding" in script
+        assert "[System.IO.File]::WriteAllText($file, $formatted, $encoding)" in script
+        assert "Set-Content" not in script
 
-        # Check best practices filter is included
-        assert "# Filter to include only best practices rules" in script
-        assert "$categoryRules = @(" in script
-        assert "RuleCategory" in script
-        assert "BestPractices" in script
-
-    def test_generate_analysis_script_with_dsc_filter(self) -> None:
-        """Test generating analysis script with DSC filter."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("$files", dsc_only=True)
-
-        # Check DSC filter is included
-        assert "# Filter to include only DSC-related rules" in script
-        assert "$categoryRules = @(" in script
-        assert "RuleCategory" in script
-        assert "DSC" in script
-
-    def test_generate_analysis_script_with_compatibility_filter(self) -> None:
-        """Test generating analysis script with compatibility filter."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
-        script = generate_analysis_script("$files", compatibility_only=True)
+    def test_generate_format_script_default_encoding(self) -> None:
+        """Test that files without a BOM are read as ANSI by Windows PowerShell and as strict UTF-8 otherwise."""
+        script = generate_format_script("$files")
 
-        # Check compatibility filter is included
-        assert "# Filter to include only compatibility-related rules" in script
-        assert "$categoryRules = @(" in script
-        assert "RuleCategory" in script
-        assert "Compatibility" in script
+        assert 'if ($PSVersionTable.PSEdition -eq "Core") {' in script
+        assert "$defaultEncoding = [System.Text.UTF8Encoding]::new($false, $true)" in script
+        assert "$defaultEncoding = [System.Text.Encoding]::Default" in script
+        assert "[System.IO.StreamReader]::new($file, $defaultEncoding, $true)" in script
 
     def test_generate_analysis_script_with_include_rules(self) -> None:
         """Test generating analysis script with include rules."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
         script = generate_analysis_script("$files", include_rules=["Rule1", "Rule2"])
 
         # Check include rules filter is included
         assert "# Filter to include only specific rules" in script
-        assert "$includeRules = @(" in script
+        assert "$includeRules = [System.Collections.Generic.HashSet[string]]::new(" in script
+        assert "[System.StringComparer]::OrdinalIgnoreCase" in script
+        assert "$includeRules.Contains($_.RuleName)" in script
         assert "'Rule1'" in script
         assert "'Rule2'" in script
 
     def test_generate_analysis_script_with_exclude_rules(self) -> None:
         """Test generating analysis script with exclude rules."""
-        from py_psscriptanalyzer.scripts import generate_analysis_script
-
         script = generate_analysis_script("$files", exclude_rules=["Rule1", "Rule2"])
 
         # Check exclude rules filter is included
         assert "# Filter to exclude specific rules" in script
-        assert "$excludeRules = @(" in script
+        assert "$excludeRules = [System.Collections.Generic.HashSet[string]]::new(" in script
+        assert "-not $excludeRules.Contains($_.RuleName)" in script
         assert "'Rule1'" in script
         assert "'Rule2'" in script
 
@@ -1,15 +1,14 @@
 """Tests for GitHub Actions integration functionality."""
 
-import os
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
-from py_psscriptanalyzer.scripts import _generate_github_actions_output, generate_analysis_script
+from py_psscriptanalyzer.core import run_script_analyzer
+from py_psscriptanalyzer.scripts import _GITHUB_ACTIONS_OUTPUT, generate_analysis_script
 
 
-def test_github_actions_output_function():
-    """Test the GitHub Actions output generation function."""
-    # This tests the function directly
-    output = _generate_github_actions_output()
+def test_github_actions_output_code():
+    """Test the GitHub Actions output code."""
+    output = _GITHUB_ACTIONS_OUTPUT
 
     # Check that it contains key parts of GitHub Actions annotation format
     assert "::" in output
@@ -17,8 +16,11 @@ def test_github_actions_output_function():
     assert "line=" in output
     assert "title=" in output
 
+    # Check that the annotation is formatted in one operation
+    assert '"::{0} file={1},line={2},title={3}::{4}" -f' in output
+
     # Check that it doesn't contain duplicate message output
-    assert output.count("Write-Host $annotation") == 1
+    assert output.count("AppendLine($annotation)") == 1
     assert "Write-Host $issue.Message" not in output
 
 
@@ -36,26 +38,23 @@ def test_github_actions_script_generation():
     assert "title=" in script
 
 
-@patch("subprocess.run")
-def test_github_actions_environment_detection(mock_run):
+@patch("py_psscriptanalyzer.core._run_powershell")
+def test_github_actions_environment_detection(mock_run, monkeypatch):
     """Test that GitHub Actions environment is properly detected."""
-    # Mock successful command execution
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.stdout = (
-        "::warning file=test.ps1,line=10,title=PSAvoidUsingPlainTextForPassword::Password should be secure"
-    )
-    mock_run.return_value = mock_process
+    # The script is piped to PowerShell from a temporary file, so read it from inside the call
+    scripts = []
+
+    def read_script(command, script, env):
+        scripts.append(script.read().decode("utf-8"))
+        return 0
+
+    mock_run.side_effect = read_script
 
     # Set GitHub Actions environment variable
-    with patch.dict(os.environ, {"GITHUB_ACTIONS": "true"}):
-        from py_psscriptanalyzer.core import run_script_analyzer
+    monkeypatch.setenv("GITHUB_ACTIONS", "true")
 
-        # Run the analyzer
-        run_script_analyzer("pwsh", ["test.ps1"])
+    # Run the analyzer
+    run_script_analyzer("pwsh", ["test.ps1"])
 
-        # Check that the script was generated with GitHub Actions detection
-        script_call = mock_run.call_args[0][0]
-        assert any(
-            '$isGitHubActions = $env:GITHUB_ACTIONS -eq "true"' in arg for arg in script_call if isinstance(arg, str)
-        )
+    # Check that the script was generated with GitHub Actions detection
+    assert '$isGitHubActions = $env:GITHUB_ACTIONS -eq "true"' in scripts[0]
@@ -0,0 +1,49 @@
+"""Tests for py_psscriptanalyzer._json module."""
+
+import io
+import json
+
+import pytest
+
+from py_psscriptanalyzer import _json
+
+RECORD = {"RuleName": "PSAvoidUsingWriteHost", "Line": 3, "Extent": {"Text": "Write-Host 'hi'"}, "Tags": []}
+NON_ASCII_RECORD = {"ScriptPath": "C:\\Users\\José\\Setup.ps1", "Message": "Größe – 日本 🎉", "Line": 1}
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "stdlib"])
+def backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> bool:
+    """Run a test against both JSON backends."""
+    if request.param and not _json._HAS_ORJSON:
+        pytest.skip("orjson not installed")
+    monkeypatch.setattr(_json, "_HAS_ORJSON", request.param)
+    return bool(request.param)
+
+
+def test_dumps_matches_stdlib_layout(backend: bool) -> None:
+    """Test that both backends produce the standard library's indent=2 layout."""
+    assert _json.dumps_indented(RECORD) == json.dumps(RECORD, indent=2)
+
+    out = io.StringIO()
+    _json.dump_indented([RECORD], out)
+    assert out.getvalue() == json.dumps([RECORD], indent=2)
+
+
+def test_dumps_escapes_non_ascii(backend: bool) -> None:
+    """Test that both backends escape non-ASCII characters, so output can be written in any encoding."""
+    text = _json.dumps_indented(NON_ASCII_RECORD)
+    assert text == json.dumps(NON_ASCII_RECORD, indent=2)
+    assert text.isascii()
+
+    out = io.StringIO()
+    _json.dump_indented([NON_ASCII_RECORD], out)
+    assert out.getvalue() == json.dumps([NON_ASCII_RECORD], indent=2)
+    assert _json.loads(out.getvalue()) == [NON_ASCII_RECORD]
+
+
+def test_loads(backend: bool) -> None:
+    """Test that both backends parse text and bytes and raise JSONDecodeError on invalid input."""
+    assert _json.loads(json.dumps(RECORD)) == RECORD
+    assert _json.loads(json.dumps(RECORD).encode()) == RECORD
+    with pytest.raises(json.JSONDecodeError):
+        _json.loads("not json")
@@ -1,12 +1,13 @@
 """Tests for security filtering and SARIF output functionality."""
 
+import argparse
 import os
 from pathlib import Path
 
 import pytest
 
 from py_psscriptanalyzer import cli
-from py_psscriptanalyzer.constants import SARIF_VERSION, SECURITY_RULES
+from py_psscriptanalyzer.constants import SARIF_VERSION, SECURITY_RULES, RuleFilter
 from py_psscriptanalyzer.core import convert_to_sarif
 from py_psscriptanalyzer.scripts import generate_analysis_script
 
@@ -28,27 +29,24 @@ class TestSecurityFilter:
         script = generate_analysis_script("'test.ps1'")
         assert "Filter to include only security-related rules" not in script
 
-    def test_main_with_security_only(self, monkeypatch: pytest.MonkeyPatch) -> None:
+    @pytest.mark.usefixtures("stub_powershell_env")
+    def test_main_with_security_only(
+        self, monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser
+    ) -> None:
         """Test main function with security_only flag."""
-        parser = cli.create_parser()
-        parser.parse_args(["--security-only", "script.ps1"])
-        monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-        # Mock function calls
-        monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-        monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+        monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
 
         # Mock run_script_analyzer to verify arguments
         called = {}
 
         def mock_run_script_analyzer(cmd, files, **kwargs):
-            called["security_only"] = kwargs.get("security_only", False)
+            called["rule_filter"] = kwargs.get("rule_filter")
             return 0
 
         monkeypatch.setattr(cli, "run_script_analyzer", mock_run_script_analyzer)
 
         cli.main(["--security-only", "script.ps1"])
-        assert called["security_only"] is True
+        assert called["rule_filter"] == RuleFilter.SECURITY
 
 
 class TestSarifOutput:
@@ -96,15 +94,12 @@ class TestSarifOutput:
         assert rule["id"] == "AvoidUsingPlainTextForPassword"
         assert "security" in rule["properties"]["tags"]
 
-    def test_main_with_sarif_output(self, monkeypatch: pytest.MonkeyPatch) -> None:
+    @pytest.mark.usefixtures("stub_powershell_env")
+    def test_main_with_sarif_output(
+        self, monkeypatch: pytest.MonkeyPatch, base_parser: argparse.ArgumentParser
+    ) -> None:
         """Test main function with sarif output format."""
-        parser = cli.create_parser()
-        parser.parse_args(["--output-format", "sarif", "script.ps1"])
-        monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-        # Mock function calls
-        monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-        monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+        monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
 
         # Mock run_script_analyzer to verify arguments
         called = {}
@@ -118,17 +113,14 @@ class TestSarifOutput:
         cli.main(["--output-format", "sarif", "script.ps1"])
         assert called["output_format"] == "sarif"
 
-    def test_output_to_file(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    @pytest.mark.usefixtures("stub_powershell_env")
+    def test_output_to_file(
+        self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path, base_parser: argparse.ArgumentParser
+    ) -> None:
         """Test writing output to a file."""
         output_file = tmp_path / "results.sarif"
 
-        parser = cli.create_parser()
-        parser.parse_args(["--output-format", "sarif", "--output-file", str(output_file), "script.ps1"])
-        monkeypatch.setattr(cli, "create_parser", lambda: parser)
-
-        # Mock function calls
-        monkeypatch.setattr(cli, "find_powershell", lambda: "pwsh")
-        monkeypatch.setattr(cli, "check_psscriptanalyzer_installed", lambda cmd: True)
+        monkeypatch.setattr(cli, "create_parser", lambda: base_parser)
 
         # Mock run_script_analyzer to verify arguments
         called = {}